@@ -0,0 +1,117 @@
+import asyncio
+import os
+import re
+import time
+from typing import Optional
+from fastapi.responses import JSONResponse
+from backend.app.metrics import ADMISSION_QUEUE_TIME, ADMISSION_REJECTIONS
+
+class Bulkhead:
+    """
+    Bounds how many requests of one route class run at once and how many may queue for a slot. Requests beyond the
+    queue depth are turned away immediately instead of holding a worker thread the other route classes need.
+    """
+    def __init__(self,name:str,max_concurrency:int,max_queue:int,queue_timeout:float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.__slots = asyncio.Semaphore(max_concurrency)
+
+    @classmethod
+    def from_environment(cls,name:str,max_concurrency:int,max_queue:int,queue_timeout:float)->'Bulkhead':
+        """
+        Create the bulkhead from the ``ADMISSION_<NAME>_CONCURRENCY``, ``ADMISSION_<NAME>_QUEUE`` and
+        ``ADMISSION_<NAME>_QUEUE_TIMEOUT`` environment variables, falling back to the given values for any that are
+        not set.
+        """
+        prefix = f"ADMISSION_{name.upper()}"
+        return cls(
+            name=name,
+            max_concurrency=int(os.getenv(f"{prefix}_CONCURRENCY",max_concurrency)),
+            max_queue=int(os.getenv(f"{prefix}_QUEUE",max_queue)),
+            queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT",queue_timeout))
+        )
+
+    async def acquire(self)->Optional[str]:
+        """
+        Wait for a slot, recording the time spent queued.
+
+        ### Returns
+        ``None`` once a slot is held, which the caller must ``release``, or the reason the request was rejected:
+        ``queue_full`` or ``queue_timeout``.
+        """
+        if not self.__slots.locked():
+            # A free slot is taken without suspending, so it never counts against the queue
+            await self.__slots.acquire()
+            ADMISSION_QUEUE_TIME.observe(0.0,self.name)
+            return None
+        if self.waiting >= self.max_queue:
+            ADMISSION_REJECTIONS.inc(1,self.name,'queue_full')
+            return 'queue_full'
+
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.__slots.acquire(),timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            ADMISSION_REJECTIONS.inc(1,self.name,'queue_timeout')
+            return 'queue_timeout'
+        finally:
+            self.waiting -= 1
+            ADMISSION_QUEUE_TIME.observe(time.perf_counter() - started,self.name)
+        return None
+
+    def release(self)->None:
+        self.__slots.release()
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware placing each request in the bulkhead of its route class. Routes matching no rule, such as the map
+    layers, tiles and the health check, are never queued, so they keep their latency while LLM or export requests
+    pile up.
+    """
+    def __init__(self,app,rules:list[tuple[set[str],str,Bulkhead]]):
+        """
+        ### Parameters
+        1. app : ``ASGIApp``
+            - Application being wrapped.
+        2. rules : ``list[tuple[set[str], str, Bulkhead]]``
+            - HTTP methods, full-match path pattern and bulkhead of each route class. The first matching rule wins.
+        """
+        self.app = app
+        self.rules = [(methods,re.compile(pattern),bulkhead) for methods,pattern,bulkhead in rules]
+
+    async def __call__(self,scope,receive,send):
+        bulkhead = self.__classify(scope) if scope["type"] == "http" else None
+        if bulkhead is None:
+            await self.app(scope,receive,send)
+            return
+
+        rejection = await bulkhead.acquire()
+        if rejection is not None:
+            await self.__rejection_response(bulkhead,rejection)(scope,receive,send)
+            return
+        try:
+            await self.app(scope,receive,send)
+        finally:
+            bulkhead.release()
+
+    def __classify(self,scope)->Optional[Bulkhead]:
+        for methods,pattern,bulkhead in self.rules:
+            if scope["method"] in methods and pattern.fullmatch(scope["path"]):
+                return bulkhead
+        return None
+
+    @staticmethod
+    def __rejection_response(bulkhead:Bulkhead,rejection:str)->JSONResponse:
+        # A full queue is the client's cue to back off; a slot that never frees up means the server is overloaded
+        if rejection == 'queue_full':
+            status_code = 429
+            error = f"Too many {bulkhead.name} requests are queued, try again shortly"
+        else:
+            status_code = 503
+            error = f"No {bulkhead.name} capacity became available within {bulkhead.queue_timeout:g}s"
+        headers = {'Retry-After': str(max(1,round(bulkhead.queue_timeout)))}
+        return JSONResponse(content={"error": error},status_code=status_code,headers=headers)
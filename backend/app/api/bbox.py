@@ -0,0 +1,21 @@
+import math
+
+
+def parse_bbox(bbox: str) -> tuple:
+    """
+    Parse a "min_lon,min_lat,max_lon,max_lat" string into a tuple of floats, raising ValueError if it is malformed,
+    out of order or off the globe.
+    """
+    try:
+        bounds = tuple(float(value) for value in bbox.split(","))
+    except ValueError as exc:
+        raise ValueError("bbox must contain four numbers") from exc
+
+    if len(bounds) != 4 or not all(math.isfinite(value) for value in bounds):
+        raise ValueError("bbox must contain four numbers")
+    min_lon, min_lat, max_lon, max_lat = bounds
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox must be ordered as min_lon,min_lat,max_lon,max_lat")
+    if min_lon < -180 or max_lon > 180 or min_lat < -90 or max_lat > 90:
+        raise ValueError("bbox longitudes must be within [-180, 180] and latitudes within [-90, 90]")
+    return bounds
@@ -0,0 +1,49 @@
+"""
+HTTP caching helpers shared by the map-data endpoints of the backend app and the root server.
+
+Every response carries a strong ETag and a Cache-Control header, and requests whose If-None-Match
+matches the current ETag get an empty 304 instead of the body.
+"""
+import hashlib
+import os
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# Browsers may reuse a response for a minute, after that they revalidate with If-None-Match
+MAP_DATA_CACHE_CONTROL = "public, max-age=60, must-revalidate"
+
+
+def file_etag(stat: os.stat_result) -> str:
+    """ETag derived from a file's modification time and size, so the file never has to be read."""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def content_etag(*parts) -> str:
+    """ETag derived from a hash of the given bytes, or of the repr of any other values."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else repr(part).encode("utf-8"))
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against the ETag, using the weak comparison RFC 9110 requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def cache_headers(etag: str, cache_control: str = MAP_DATA_CACHE_CONTROL) -> dict:
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+def not_modified_response(request: Request, etag: str, cache_control: str = MAP_DATA_CACHE_CONTROL) -> Optional[Response]:
+    """Return a 304 response if the client already holds the current representation, otherwise None."""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=cache_headers(etag, cache_control))
+    return None
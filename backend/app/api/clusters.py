@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse, Response
+from typing import Optional
+import json
+
+from .bbox import parse_bbox
+from .caching import cache_headers, content_etag, not_modified_response
+from .tiles import LAYER_NAME, resolve_file_layer
+from ..geo.clustering import ClusterCache
+
+router = APIRouter(prefix="/clusters", tags=["Clusters"])
+cluster_cache = ClusterCache(resolve_file_layer)
+
+@router.get("/{layer}")
+def get_clusters(
+    layer: str,
+    request: Request,
+    zoom: int = Query(..., ge=0, le=22),
+    bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat"),
+):
+    """Return the point clusters of a layer at a map zoom, with lone points as their original features."""
+    if not LAYER_NAME.match(layer):
+        return JSONResponse({"error": f"{layer} not found"}, status_code=404)
+    try:
+        bounds = parse_bbox(bbox) if bbox else None
+    except ValueError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=400)
+
+    version = cluster_cache.version(layer)
+    if version is None:
+        return JSONResponse({"error": f"{layer} not found"}, status_code=404)
+
+    etag = content_etag(layer, version, zoom, bounds)
+    not_modified = not_modified_response(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    # The index is built once per data version, a request only filters the clusters of one zoom
+    index = cluster_cache.index(layer)
+    if index is None:
+        # The layer was removed between the version check and the build
+        return JSONResponse({"error": f"{layer} not found"}, status_code=404)
+    features = index.clusters(zoom, bounds)
+    content = json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":")).encode("utf-8")
+    return Response(content, media_type="application/geo+json", headers=cache_headers(etag))
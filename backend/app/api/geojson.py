@@ -1,27 +1,183 @@
-from fastapi import APIRouter
-from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
-import os, json
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from typing import List, Optional
+import os
+
+from .bbox import parse_bbox
+from .caching import cache_headers, content_etag, file_etag, not_modified_response
+from .layer_cache import InvalidLayerError, LayerCache
+from ..geo.feature_index import FeatureIndexCache, iterate_feature_collection
+from ..geo.simplify import FULL_DETAIL_ZOOM, LevelOfDetailCache, simplify_feature, zoom_for_tolerance
 
 router = APIRouter(prefix="/geojson", tags=["GeoJSON"])
 BASE = os.path.join(os.getcwd(), "data")
+# Layers above this size are served from disk with sendfile and Range support instead of the layer cache
+LARGE_LAYER_SIZE = 10_000_000
+layer_cache = LayerCache.from_environment()
+lod_cache = LevelOfDetailCache.from_environment()
+feature_indexes = FeatureIndexCache()
 
 def file_path(layer: str):
     return os.path.join(BASE, f"{layer}.geojson")
 
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Check whether the Accept-Encoding header allows gzip (a q of 0 explicitly refuses it)."""
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            q = params.strip().lower()
+            if not q.startswith("q="):
+                return True
+            try:
+                return float(q[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+def gzip_sidecar(path: str, stat: os.stat_result):
+    """Return the path and stat of the precompressed copy if one exists and is not older than the layer."""
+    sidecar = path + ".gz"
+    try:
+        sidecar_stat = os.stat(sidecar)
+    except FileNotFoundError:
+        return None
+    if sidecar_stat.st_mtime_ns < stat.st_mtime_ns:
+        return None
+    return sidecar, sidecar_stat
+
+def parse_conditions(conditions: List[str]):
+    """Parse repeated "name=value" parameters into (name, value) pairs, raising ValueError if one has no "="."""
+    pairs = []
+    for condition in conditions:
+        name, separator, value = condition.partition("=")
+        if not separator or not name:
+            raise ValueError(f"expected name=value, got {condition!r}")
+        pairs.append((name, value))
+    return sorted(pairs)
+
+def property_filter(equals: list, prefixes: list, level: Optional[int]):
+    """Build the per-feature filter for the streamed response, or None if features can be copied as is."""
+    if not equals and not prefixes and level is None:
+        return None
+
+    def keep(feature: dict):
+        properties = feature.get("properties") or {}
+        for name, value in equals:
+            # Query values are strings, so numeric properties such as year are compared by their text
+            if name not in properties or str(properties[name]) != value:
+                return None
+        for name, value in prefixes:
+            # A missing or null property matches no prefix, rather than being compared as the text "None"
+            if properties.get(name) is None or not str(properties[name]).startswith(value):
+                return None
+        return simplify_feature(feature, level) if level is not None else feature
+    return keep
+
 @router.get("/{layer}")
-def get_geojson(layer: str):
-    """Return GeoJSON layers efficiently."""
+def get_geojson(
+    layer: str,
+    request: Request,
+    zoom: Optional[int] = Query(None, ge=0, le=22),
+    tolerance: Optional[float] = Query(None, gt=0),
+    bbox: Optional[str] = Query(None, description="min_lon,min_lat,max_lon,max_lat"),
+    where: List[str] = Query([], description="name=value, matching properties exactly"),
+    prefix: List[str] = Query([], description="name=value, matching properties starting with value"),
+):
+    """
+    Return GeoJSON layers efficiently, simplified for the map zoom or tolerance (in degrees) if given,
+    and limited to the features matching the bbox and property filters if any are given.
+    """
     path = file_path(layer)
     if not os.path.exists(path):
         return JSONResponse({"error": f"{layer}.geojson not found"}, status_code=404)
 
-    size = os.path.getsize(path)
-    # Serve large file as stream, smaller ones as JSON
-    if size > 10_000_000:  # 10 MB threshold
-        def iterfile():
-            with open(path, "rb") as f:
-                yield from f
-        return StreamingResponse(iterfile(), media_type="application/geo+json")
+    try:
+        bounds = parse_bbox(bbox) if bbox else None
+        equals = parse_conditions(where)
+        prefixes = parse_conditions(prefix)
+    except ValueError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=400)
+
+    stat = os.stat(path)
+    # A tolerance is snapped to the zoom level whose detail matches it, so both share the cached levels
+    level = zoom_for_tolerance(tolerance) if tolerance is not None else zoom
+    if level is not None and level >= FULL_DETAIL_ZOOM:
+        level = None
+
+    if bounds or equals or prefixes:
+        return filtered_layer_response(request, path, stat, bounds, equals, prefixes, level)
+    if level is not None:
+        return simplified_layer_response(request, path, stat, level)
+
+    size = stat.st_size
+    # Serve large files from disk with sendfile and Range support, smaller ones from the layer cache
+    if size > LARGE_LAYER_SIZE:
+        return large_layer_response(request, path, stat)
+
+    # The ETag only depends on the file metadata, so unchanged layers are answered without reading them
+    etag = file_etag(stat)
+    not_modified = not_modified_response(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        content = layer_cache.get(path, stat)
+    except InvalidLayerError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=500)
+    return Response(content, media_type="application/geo+json", headers=cache_headers(etag))
+
+def filtered_layer_response(request: Request, path: str, stat: os.stat_result, bounds, equals: list, prefixes: list, level: Optional[int]):
+    """Stream the matching features, reading only the candidates the layer's feature index points to."""
+    etag = content_etag(file_etag(stat), bounds, equals, prefixes, level)
+    not_modified = not_modified_response(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        index = feature_indexes.get(path, stat)
+    except ValueError:
+        return JSONResponse({"error": f"{os.path.basename(path)} is not valid JSON"}, status_code=500)
+
+    features = index.iterate_features(index.candidates(bounds))
+    return StreamingResponse(
+        iterate_feature_collection(features, property_filter(equals, prefixes, level)),
+        media_type="application/geo+json",
+        headers=cache_headers(etag),
+    )
+
+def simplified_layer_response(request: Request, path: str, stat: os.stat_result, level: int):
+    """Send the layer simplified and quantized for one zoom level."""
+    etag = f'{file_etag(stat)[:-1]}-z{level}"'
+    not_modified = not_modified_response(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        content = lod_cache.get(path, stat, level)
+    except ValueError:
+        return JSONResponse({"error": f"{os.path.basename(path)} is not valid JSON"}, status_code=500)
+    return Response(content, media_type="application/geo+json", headers=cache_headers(etag))
+
+def large_layer_response(request: Request, path: str, stat: os.stat_result):
+    """Send a large layer as a file, using the .gz sidecar when the client accepts gzip and wants the whole body."""
+    sidecar = None
+    # Byte ranges refer to the identity encoding, so range requests always get the uncompressed file
+    if "range" not in request.headers and accepts_gzip(request.headers.get("accept-encoding", "")):
+        sidecar = gzip_sidecar(path, stat)
+
+    # Each encoding is a separate representation and needs its own ETag
+    if sidecar is not None:
+        path, stat = sidecar
+        etag = '"gz-' + file_etag(stat)[1:]
     else:
-        with open(path) as f:
-            return JSONResponse(json.load(f))
+        etag = file_etag(stat)
+
+    not_modified = not_modified_response(request, etag)
+    if not_modified is not None:
+        not_modified.headers["Vary"] = "Accept-Encoding"
+        return not_modified
+
+    headers = {**cache_headers(etag), "Vary": "Accept-Encoding"}
+    if sidecar is not None:
+        headers["Content-Encoding"] = "gzip"
+    return FileResponse(path, media_type="application/geo+json", headers=headers, stat_result=stat)
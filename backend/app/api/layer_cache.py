@@ -0,0 +1,62 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+# Layers are held as raw bytes, so the budget is the total size of the cached files
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class InvalidLayerError(ValueError):
+    """Raised when a layer file is not valid GeoJSON."""
+
+
+class LayerCache:
+    """LRU cache of validated GeoJSON layer bytes, keyed by path and invalidated when the file changes."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> "LayerCache":
+        return cls(max_bytes=int(os.getenv("GEOJSON_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)))
+
+    def get(self, path: str, stat: os.stat_result) -> bytes:
+        """Return the layer's bytes, reading and validating the file only when it is new or changed."""
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(path)
+                return entry[1]
+
+        content = self._load(path)
+
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self.total_bytes -= len(previous[1])
+            # A layer larger than the whole budget is served but never cached
+            if len(content) <= self.max_bytes:
+                self._entries[path] = (version, content)
+                self.total_bytes += len(content)
+                while self.total_bytes > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.total_bytes -= len(evicted)
+        return content
+
+    def _load(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            content = f.read()
+        # Parsed once here so requests can serve the bytes without re-encoding them
+        try:
+            layer = json.loads(content)
+        except ValueError as exc:
+            raise InvalidLayerError(f"{os.path.basename(path)} is not valid JSON") from exc
+        if not isinstance(layer, dict) or "type" not in layer:
+            raise InvalidLayerError(f"{os.path.basename(path)} is not a GeoJSON object")
+        return content
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from ..db.connection import execute_query
+from ..db.connection import execute_query, pool_stats
 
 router = APIRouter(prefix="/query", tags=["Query"])
 
@@ -11,3 +11,9 @@ def test_query():
         return {"status": "success", "result": result}
     except Exception as e:
         return {"status": "error", "detail": str(e)}
+
+
+@router.get("/pool")
+def get_pool_stats():
+    """Connection pool wait time and utilization"""
+    return pool_stats()
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, Response
+import json, os, re
+
+from .caching import cache_headers, content_etag, file_etag, not_modified_response
+from .geojson import file_path
+from ..geo.tiling import TileCache, valid_tile
+
+router = APIRouter(prefix="/tiles", tags=["Tiles"])
+LAYER_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+def resolve_file_layer(layer: str):
+    """Map a layer name to the version and loader of its file under /geojson's data directory."""
+    path = file_path(layer)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    def load():
+        with open(path, "rb") as f:
+            return json.load(f).get("features", [])
+    return file_etag(stat).strip('"'), load
+
+tile_cache = TileCache.from_environment(resolve_file_layer)
+
+@router.get("/{layer}/{z}/{x}/{y}")
+def get_tile(layer: str, z: int, x: int, y: int, request: Request):
+    """Return the features of a layer intersecting one z/x/y map tile."""
+    if not LAYER_NAME.match(layer) or not valid_tile(z, x, y):
+        return JSONResponse({"error": f"tile {layer}/{z}/{x}/{y} not found"}, status_code=404)
+
+    version = tile_cache.version(layer)
+    if version is None:
+        return JSONResponse({"error": f"{layer} not found"}, status_code=404)
+
+    # Tiles only change with the layer version, so revalidation never needs the tile itself
+    etag = content_etag(layer, version, z, x, y)
+    not_modified = not_modified_response(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    content = tile_cache.tile(layer, z, x, y)
+    if content is None:
+        return JSONResponse({"error": f"{layer} not found"}, status_code=404)
+    return Response(content, media_type="application/geo+json", headers=cache_headers(etag))
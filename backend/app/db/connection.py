@@ -1,9 +1,10 @@
 import os
-import psycopg2
-from psycopg2 import pool
 from dotenv import load_dotenv
 from contextlib import contextmanager
 
+from .pool import get_pool
+from ..metrics import DB_QUERY_DURATION
+
 load_dotenv()
 
 DB_URL = os.getenv("DATABASE_URL")
@@ -12,28 +13,28 @@ _pg_pool = None
 
 def init_db():
     global _pg_pool
-    _pg_pool = psycopg2.pool.SimpleConnectionPool(
-        minconn=1,
-        maxconn=5,
-        dsn=DB_URL
-    )
+    # Shared with the root server's SQLAgent when both run in the same process
+    _pg_pool = get_pool(DB_URL)
     print(" database connection pool created")
 
 @contextmanager
 def get_conn():
-    conn = _pg_pool.getconn()
-    try:
+    with _pg_pool.connection() as conn:
         yield conn
-    finally:
-        _pg_pool.putconn(conn)
+
+def pool_stats():
+    """Return wait time and utilization stats of the connection pool"""
+    return _pg_pool.stats()
+
 def execute_query(query, params=None):
     """Run a SQL query and return results as a list of dicts"""
     with get_conn() as conn:
         with conn.cursor() as cur:
-            cur.execute(query, params or ())
+            with DB_QUERY_DURATION.time("execute_query"):
+                cur.execute(query, params or ())
+                rows = cur.fetchall() if cur.description else None
             if cur.description:  # if it’s a SELECT query
                 columns = [desc[0] for desc in cur.description]
-                rows = cur.fetchall()
                 return [dict(zip(columns, row)) for row in rows]
             else:
                 conn.commit()
@@ -0,0 +1,238 @@
+"""
+Thread-safe connection pool shared by the backend app and the root server.
+
+FastAPI runs sync handlers on a thread pool, so every access to the pool state happens under a lock.
+Unlike psycopg2's own pools, callers wait for a free connection instead of failing when the pool is exhausted,
+and up to maxconn idle connections are kept open rather than closing everything above minconn. Connections are
+health checked after sitting idle and recycled once they reach their maximum lifetime.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+
+from ..metrics import POOL_WAIT
+
+DEFAULT_MIN_CONNECTIONS = 1
+DEFAULT_MAX_CONNECTIONS = 5
+DEFAULT_ACQUIRE_TIMEOUT = 30.0
+DEFAULT_MAX_LIFETIME = 1800.0
+DEFAULT_HEALTH_CHECK_INTERVAL = 30.0
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection became available within the acquire timeout."""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of psycopg2 connections with wait time and utilization stats."""
+
+    def __init__(
+        self,
+        dsn,
+        minconn=DEFAULT_MIN_CONNECTIONS,
+        maxconn=DEFAULT_MAX_CONNECTIONS,
+        acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT,
+        max_lifetime=DEFAULT_MAX_LIFETIME,
+        health_check_interval=DEFAULT_HEALTH_CHECK_INTERVAL,
+        read_only=False,
+    ):
+        self.dsn = dsn
+        self.read_only = read_only
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+
+        # Connections are opened on first use, so creating the pool never blocks on the database
+        self._idle = []
+        self._opened = False
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._created_at = {}
+        self._released_at = {}
+
+        self._in_use = 0
+        self._acquisitions = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._failed_health_checks = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @classmethod
+    def from_environment(cls, dsn, read_only=False):
+        """Create a pool sized by the DB_POOL_* environment variables."""
+        return cls(
+            dsn,
+            read_only=read_only,
+            minconn=int(os.getenv("DB_POOL_MIN", DEFAULT_MIN_CONNECTIONS)),
+            maxconn=int(os.getenv("DB_POOL_MAX", DEFAULT_MAX_CONNECTIONS)),
+            acquire_timeout=float(os.getenv("DB_POOL_TIMEOUT", DEFAULT_ACQUIRE_TIMEOUT)),
+            max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", DEFAULT_MAX_LIFETIME)),
+            health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", DEFAULT_HEALTH_CHECK_INTERVAL)),
+        )
+
+    def getconn(self):
+        """Borrow a healthy connection, waiting up to acquire_timeout for one to be returned."""
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(f"No database connection available after {self.acquire_timeout}s")
+        waited = time.perf_counter() - started
+        POOL_WAIT.observe(waited)
+
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use += 1
+            self._acquisitions += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a borrowed connection, closing it if it is broken or past its maximum lifetime."""
+        expired = time.monotonic() - self._created_at.get(id(conn), 0.0) > self.max_lifetime
+        discard = close or expired or not self._reset(conn)
+
+        try:
+            with self._lock:
+                self._in_use -= 1
+                if discard:
+                    self._forget(conn)
+                    if expired and not close:
+                        self._recycled += 1
+                else:
+                    self._released_at[id(conn)] = time.monotonic()
+                    self._idle.append(conn)
+        finally:
+            self._slots.release()
+            if discard:
+                conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that borrows a connection and always returns it."""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        """Snapshot of the pool size, utilization and time spent waiting for connections."""
+        with self._lock:
+            idle = len(self._idle)
+            return {
+                "min_connections": self.minconn,
+                "max_connections": self.maxconn,
+                "in_use": self._in_use,
+                "idle": idle,
+                "utilization": self._in_use / self.maxconn,
+                "acquisitions": self._acquisitions,
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+                "failed_health_checks": self._failed_health_checks,
+                "total_wait_seconds": self._total_wait,
+                "average_wait_seconds": self._total_wait / self._acquisitions if self._acquisitions else 0.0,
+                "max_wait_seconds": self._max_wait,
+            }
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._created_at.clear()
+            self._released_at.clear()
+            self._opened = False
+        for conn in idle:
+            conn.close()
+
+    def _checkout(self):
+        with self._lock:
+            warm_up = not self._opened
+            self._opened = True
+        if warm_up:
+            connections = [self._connect() for _ in range(self.minconn)]
+            with self._lock:
+                self._idle.extend(connections)
+
+        # A slot is held, so either an idle connection is available or a new one may be opened
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._connect()
+
+            idle_for = time.monotonic() - self._released_at.get(id(conn), 0.0)
+            if not conn.closed and (idle_for < self.health_check_interval or self._is_healthy(conn)):
+                return conn
+
+            with self._lock:
+                self._failed_health_checks += 1
+                self._forget(conn)
+            conn.close()
+
+    def _connect(self):
+        dsn = self.dsn
+        if self.read_only:
+            # Set when the session starts, so no statement run on the connection can write, even after a COMMIT
+            options = extensions.parse_dsn(dsn).get("options", "")
+            dsn = extensions.make_dsn(dsn, options=f"{options} -c default_transaction_read_only=on".strip())
+        conn = psycopg2.connect(dsn)
+        with self._lock:
+            self._created_at[id(conn)] = time.monotonic()
+            self._released_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _reset(self, conn):
+        """Roll back any open transaction, returns False if the connection is no longer usable."""
+        if conn.closed:
+            return False
+        try:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                return False
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _is_healthy(self, conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            # End the transaction opened by the check so the caller starts from a clean state
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _forget(self, conn):
+        self._created_at.pop(id(conn), None)
+        self._released_at.pop(id(conn), None)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(dsn, read_only=False):
+    """
+    Return the process-wide pool for the DSN, so every caller shares the same connections.
+    Read-only pools are kept apart, their sessions can never write.
+    """
+    key = (dsn, read_only)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool.from_environment(dsn, read_only=read_only)
+        return _pools[key]
@@ -0,0 +1,193 @@
+import math
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+
+
+MIN_ZOOM = 0
+# Above this zoom every point is returned on its own
+MAX_ZOOM = 16
+# Cluster radius in pixels of a 512 px tile, as in supercluster
+RADIUS = 60
+EXTENT = 512
+
+
+def project(lons: np.ndarray, lats: np.ndarray) -> tuple:
+    """Project longitude/latitude to Web Mercator coordinates in [0, 1]."""
+    x = lons / 360.0 + 0.5
+    sin = np.sin(np.radians(np.clip(lats, -85.0511287798, 85.0511287798)))
+    y = 0.5 - 0.25 * np.log((1 + sin) / (1 - sin)) / math.pi
+    return x, y
+
+
+def unproject(x: np.ndarray, y: np.ndarray) -> tuple:
+    lons = (x - 0.5) * 360.0
+    lats = np.degrees(2 * np.arctan(np.exp((180.0 - y * 360.0) * math.pi / 180.0)) - math.pi / 2)
+    return lons, lats
+
+
+class ClusterLevel:
+    """Clusters at one zoom: weighted centroid, point count and, for single points, the original feature row."""
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, counts: np.ndarray, rows: np.ndarray):
+        self.x = x
+        self.y = y
+        self.counts = counts
+        self.rows = rows
+
+
+class ClusterIndex:
+    """
+    Hierarchical greedy clustering of a point layer, built once from the highest zoom down, supercluster-style.
+
+    Each zoom merges the clusters of the zoom above that lie within RADIUS pixels of each other, so a query is a
+    vectorized bbox filter over the clusters of a single zoom.
+    """
+
+    def __init__(self, features: list, min_zoom: int = MIN_ZOOM, max_zoom: int = MAX_ZOOM, radius: int = RADIUS):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+
+        self.features = []
+        lons, lats = [], []
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            coordinates = geometry.get("coordinates") or ()
+            if geometry.get("type") != "Point" or len(coordinates) < 2:
+                continue
+            self.features.append(feature)
+            lons.append(coordinates[0])
+            lats.append(coordinates[1])
+
+        x, y = project(np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        level = ClusterLevel(x, y, np.ones(len(x), dtype=np.int64), np.arange(len(x)))
+        self.levels = {max_zoom + 1: level}
+        for zoom in range(max_zoom, min_zoom - 1, -1):
+            level = self._cluster(level, radius / (EXTENT * 2 ** zoom))
+            self.levels[zoom] = level
+
+    def clusters(self, zoom: int, bbox: Optional[tuple] = None) -> list:
+        """
+        Return GeoJSON features for the zoom: clusters carry cluster, cluster_id and point_count properties,
+        lone points are returned as their original feature.
+        """
+        zoom = min(max(zoom, self.min_zoom), self.max_zoom + 1)
+        level = self.levels[zoom]
+
+        rows = np.arange(len(level.x))
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            (min_x, max_x), (max_y, min_y) = project(np.array([min_lon, max_lon]), np.array([min_lat, max_lat]))
+            rows = np.flatnonzero((level.x >= min_x) & (level.x <= max_x) & (level.y >= min_y) & (level.y <= max_y))
+
+        lons, lats = unproject(level.x[rows], level.y[rows])
+        features = []
+        for row, lon, lat in zip(rows.tolist(), lons.tolist(), lats.tolist()):
+            if level.counts[row] == 1:
+                features.append(self.features[level.rows[row]])
+                continue
+            features.append({
+                "type": "Feature",
+                "id": f"{zoom}-{row}",
+                "properties": {"cluster": True, "cluster_id": f"{zoom}-{row}", "point_count": int(level.counts[row])},
+                "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            })
+        return features
+
+    def _cluster(self, level: ClusterLevel, radius: float) -> ClusterLevel:
+        count = len(level.x)
+        if not count:
+            return level
+
+        # Bucket the clusters into cells one radius wide, so neighbours are only searched in the 3x3 cells around
+        cells_x = np.floor(level.x / radius).astype(np.int64)
+        cells_y = np.floor(level.y / radius).astype(np.int64)
+        grid = {}
+        for index, cell in enumerate(zip(cells_x.tolist(), cells_y.tolist())):
+            grid.setdefault(cell, []).append(index)
+
+        visited = np.zeros(count, dtype=bool)
+        radius_squared = radius * radius
+        xs, ys, counts, rows = [], [], [], []
+        for index in range(count):
+            if visited[index]:
+                continue
+            visited[index] = True
+            x, y = level.x[index], level.y[index]
+            weight = level.counts[index]
+            total_x, total_y, total = x * weight, y * weight, weight
+
+            cell_x, cell_y = cells_x[index], cells_y[index]
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for neighbour in grid.get((cell_x + dx, cell_y + dy), ()):
+                        if visited[neighbour]:
+                            continue
+                        if (level.x[neighbour] - x) ** 2 + (level.y[neighbour] - y) ** 2 > radius_squared:
+                            continue
+                        visited[neighbour] = True
+                        neighbour_weight = level.counts[neighbour]
+                        total_x += level.x[neighbour] * neighbour_weight
+                        total_y += level.y[neighbour] * neighbour_weight
+                        total += neighbour_weight
+
+            xs.append(total_x / total)
+            ys.append(total_y / total)
+            counts.append(total)
+            rows.append(level.rows[index] if total == 1 else -1)
+
+        return ClusterLevel(
+            np.asarray(xs, dtype=np.float64),
+            np.asarray(ys, dtype=np.float64),
+            np.asarray(counts, dtype=np.int64),
+            np.asarray(rows, dtype=np.int64),
+        )
+
+
+class ClusterCache:
+    """Keeps one cluster index per layer, rebuilt only when the layer's data version changes."""
+
+    def __init__(self, resolve: Callable[[str], Optional[tuple]]):
+        self.resolve = resolve
+        self._registered = {}
+        self._indexes = {}
+        self._build_locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, layer: str, version: str, features: list):
+        """Serve an in-memory layer, taking precedence over any layer of the same name that resolve finds."""
+        with self._lock:
+            self._registered[layer] = (version, lambda: features)
+
+    def version(self, layer: str) -> Optional[str]:
+        source = self._source(layer)
+        return source[0] if source else None
+
+    def index(self, layer: str) -> Optional[ClusterIndex]:
+        """Return the layer's cluster index, or None if the layer does not exist."""
+        source = self._source(layer)
+        if source is None:
+            return None
+        version, load = source
+
+        with self._lock:
+            entry = self._indexes.get(layer)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            build_lock = self._build_locks.setdefault(layer, threading.Lock())
+
+        # Built under the layer's own lock, so clustering one layer never holds up requests for the others
+        with build_lock:
+            with self._lock:
+                entry = self._indexes.get(layer)
+            if entry is None or entry[0] != version:
+                entry = (version, ClusterIndex(load()))
+                with self._lock:
+                    self._indexes[layer] = entry
+            return entry[1]
+
+    def _source(self, layer: str) -> Optional[tuple]:
+        with self._lock:
+            registered = self._registered.get(layer)
+        return registered if registered is not None else self.resolve(layer)
@@ -0,0 +1,194 @@
+import json
+import os
+import re
+import threading
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+
+from .tiling import geometry_bounds
+
+
+CHUNK_SIZE = 1024 * 1024
+# Only these bytes change the scanner's state; everything between them is skipped in bulk
+STRUCTURAL = re.compile(rb'[{}\[\]"\\]')
+
+
+def scan_features(f, chunk_size: int = CHUNK_SIZE) -> Iterator[tuple]:
+    """
+    Walk a GeoJSON FeatureCollection incrementally and yield (offset, feature bytes) for each feature.
+
+    Only the brackets, quotes and escapes are tracked, so memory use is bounded by the largest single feature
+    rather than the file.
+    """
+    depth = 0
+    offset = 0
+    in_string = False
+    carried_escape = False
+    features_depth = None
+    key = bytearray()
+    key_from = 0
+    feature = None
+    feature_start = feature_from = 0
+
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        # An escape at the very end of the previous chunk applies to this chunk's first byte
+        skip_index = 0 if carried_escape else -1
+        carried_escape = False
+
+        for match in STRUCTURAL.finditer(chunk):
+            index = match.start()
+            if index == skip_index:
+                continue
+            token = match.group()
+
+            if in_string:
+                if token == b"\\":
+                    skip_index = index + 1
+                    carried_escape = skip_index == len(chunk)
+                elif token == b'"':
+                    in_string = False
+                    if depth == 1:
+                        key += chunk[key_from:index]
+                continue
+
+            if token == b'"':
+                in_string = True
+                if depth == 1:
+                    key = bytearray()
+                    key_from = index + 1
+            elif token in (b"{", b"["):
+                depth += 1
+                # The last string read at the top level before an array opens is that array's key
+                if features_depth is None and token == b"[" and depth == 2 and key == b"features":
+                    features_depth = depth
+                elif features_depth is not None and depth == features_depth + 1:
+                    feature = bytearray()
+                    feature_start = offset + index
+                    feature_from = index
+            elif token in (b"}", b"]"):
+                depth -= 1
+                if feature is not None and depth == features_depth:
+                    feature += chunk[feature_from:index + 1]
+                    yield feature_start, bytes(feature)
+                    feature = None
+                elif features_depth is not None and depth < features_depth:
+                    return
+
+        if in_string and depth == 1:
+            key += chunk[key_from:]
+            key_from = 0
+        if feature is not None:
+            feature += chunk[feature_from:]
+            feature_from = 0
+        offset += len(chunk)
+
+
+class FeatureIndex:
+    """Byte offset, length and bounding box of every feature in one version of a layer file."""
+
+    def __init__(self, path: str, version: tuple, offsets: np.ndarray, lengths: np.ndarray, bounds: np.ndarray):
+        self.path = path
+        self.version = version
+        self.offsets = offsets
+        self.lengths = lengths
+        self.min_lon, self.min_lat, self.max_lon, self.max_lat = bounds.reshape(-1, 4).T
+
+    @classmethod
+    def build(cls, path: str, stat: os.stat_result) -> "FeatureIndex":
+        """Scan the file once, parsing one feature at a time to record its bounding box."""
+        offsets, lengths, bounds = [], [], []
+        missing = (np.nan,) * 4
+        with open(path, "rb") as f:
+            for offset, feature in scan_features(f):
+                offsets.append(offset)
+                lengths.append(len(feature))
+                # Features without a geometry get NaN bounds, which no bbox filter matches
+                bounds.append(geometry_bounds(json.loads(feature).get("geometry")) or missing)
+        return cls(
+            path,
+            (stat.st_mtime_ns, stat.st_size),
+            np.asarray(offsets, dtype=np.int64),
+            np.asarray(lengths, dtype=np.int64),
+            np.asarray(bounds, dtype=np.float64),
+        )
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def candidates(self, bbox: Optional[tuple] = None) -> np.ndarray:
+        """Rows, in file order, of the features whose bounding box intersects the bbox (all of them without one)."""
+        if bbox is None:
+            return np.arange(len(self))
+        min_lon, min_lat, max_lon, max_lat = bbox
+        return np.flatnonzero(
+            (self.min_lon <= max_lon) & (self.max_lon >= min_lon)
+            & (self.min_lat <= max_lat) & (self.max_lat >= min_lat)
+        )
+
+    def iterate_features(self, rows: np.ndarray) -> Iterator[bytes]:
+        """Read the given features straight from their offsets, one at a time."""
+        with open(self.path, "rb") as f:
+            for row in rows:
+                f.seek(self.offsets[row])
+                yield f.read(self.lengths[row])
+
+
+class FeatureIndexCache:
+    """Keeps the feature index of each layer file, rebuilding it only when the file changes."""
+
+    def __init__(self):
+        self._indexes = {}
+        self._build_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str, stat: os.stat_result) -> FeatureIndex:
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            index = self._indexes.get(path)
+            if index is not None and index.version == version:
+                return index
+            build_lock = self._build_locks.setdefault(path, threading.Lock())
+
+        # Built under the layer's own lock, so a large layer being indexed never holds up lookups of the others
+        with build_lock:
+            with self._lock:
+                index = self._indexes.get(path)
+            # Another request may have built the index while this one waited for the lock
+            if index is None or index.version != version:
+                index = FeatureIndex.build(path, stat)
+                with self._lock:
+                    self._indexes[path] = index
+            return index
+
+
+def iterate_feature_collection(
+    features: Iterator[bytes],
+    keep: Optional[Callable[[dict], Optional[dict]]] = None,
+    chunk_size: int = 64 * 1024,
+) -> Iterator[bytes]:
+    """
+    Stream a FeatureCollection from serialized features in chunks of about chunk_size.
+
+    keep receives each parsed feature and returns the feature to write, possibly transformed, or None to
+    drop it. Without keep the features are copied through without being parsed.
+    """
+    buffer = bytearray(b'{"type":"FeatureCollection","features":[')
+    separator = b""
+    for feature in features:
+        if keep is not None:
+            kept = keep(json.loads(feature))
+            if kept is None:
+                continue
+            feature = json.dumps(kept, separators=(",", ":")).encode("utf-8")
+        buffer += separator
+        buffer += feature
+        separator = b","
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]}"
+    yield bytes(buffer)
@@ -0,0 +1,175 @@
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+
+# Beyond this zoom a pixel is smaller than the precision the layers are stored at, so they are served as is
+FULL_DETAIL_ZOOM = 18
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def pixel_tolerance(zoom: int) -> float:
+    """Width of one 256 px tile pixel in degrees of longitude at the given zoom."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def zoom_for_tolerance(tolerance: float) -> int:
+    """Lowest zoom whose pixel is no wider than the tolerance, so the level never simplifies more than asked."""
+    zoom = math.ceil(math.log2(360.0 / (256 * tolerance)))
+    return min(max(zoom, 0), FULL_DETAIL_ZOOM)
+
+
+def douglas_peucker(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Simplify a (n, 2) polyline, keeping every vertex further than tolerance from the simplified line."""
+    count = len(points)
+    if count < 3:
+        return points
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # Iterative rather than recursive so long road segments cannot hit the recursion limit
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start = points[first]
+        dx, dy = points[last] - start
+        between = points[first + 1:last] - start
+        length = math.hypot(dx, dy)
+        if length == 0:
+            # Closed rings start and end on the same vertex, so distance is measured from that vertex
+            distances = np.hypot(between[:, 0], between[:, 1])
+        else:
+            distances = np.abs(dx * between[:, 1] - dy * between[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = first + 1 + farthest
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return points[keep]
+
+
+def _quantize(points: np.ndarray, decimals: int) -> np.ndarray:
+    points = np.round(points, decimals)
+    if len(points) < 2:
+        return points
+    # Rounding can collapse neighbouring vertices onto each other
+    distinct = np.ones(len(points), dtype=bool)
+    distinct[1:] = np.any(points[1:] != points[:-1], axis=1)
+    return points[distinct]
+
+
+def _line(coordinates: list, tolerance: float, decimals: int) -> Optional[list]:
+    points = np.asarray(coordinates, dtype=np.float64)[:, :2]
+    points = _quantize(douglas_peucker(points, tolerance), decimals)
+    return points.tolist() if len(points) >= 2 else None
+
+
+def _ring(coordinates: list, tolerance: float, decimals: int) -> Optional[list]:
+    ring = _line(coordinates, tolerance, decimals)
+    # A ring needs three distinct vertices plus the closing one, otherwise it is below a pixel and dropped
+    return ring if ring is not None and len(ring) >= 4 else None
+
+
+def _polygon(rings: list, tolerance: float, decimals: int) -> Optional[list]:
+    if not rings:
+        return None
+    exterior = _ring(rings[0], tolerance, decimals)
+    if exterior is None:
+        return None
+    holes = (_ring(hole, tolerance, decimals) for hole in rings[1:])
+    return [exterior, *(hole for hole in holes if hole is not None)]
+
+
+def simplify_geometry(geometry: Optional[dict], tolerance: float, decimals: int) -> Optional[dict]:
+    """Return the geometry simplified and rounded to decimals, or None if nothing of it is left visible."""
+    if not geometry:
+        return None
+    kind = geometry.get("type")
+    coordinates = geometry.get("coordinates")
+
+    if kind == "Point":
+        simplified = [round(value, decimals) for value in coordinates[:2]] if coordinates else None
+    elif kind == "MultiPoint":
+        simplified = _quantize(np.asarray(coordinates, dtype=np.float64)[:, :2], decimals).tolist() if coordinates else None
+    elif kind == "LineString":
+        simplified = _line(coordinates, tolerance, decimals) if coordinates else None
+    elif kind == "MultiLineString":
+        simplified = [line for line in (_line(part, tolerance, decimals) for part in coordinates or ()) if line] or None
+    elif kind == "Polygon":
+        simplified = _polygon(coordinates, tolerance, decimals)
+    elif kind == "MultiPolygon":
+        simplified = [part for part in (_polygon(rings, tolerance, decimals) for rings in coordinates or ()) if part] or None
+    elif kind == "GeometryCollection":
+        parts = [simplify_geometry(part, tolerance, decimals) for part in geometry.get("geometries", [])]
+        parts = [part for part in parts if part is not None]
+        return {"type": kind, "geometries": parts} if parts else None
+    else:
+        return geometry
+
+    return {"type": kind, "coordinates": simplified} if simplified is not None else None
+
+
+def level_parameters(zoom: int) -> tuple:
+    """Simplification tolerance and rounding decimals of a zoom level."""
+    tolerance = pixel_tolerance(zoom)
+    # Rounding error stays under half a pixel
+    return tolerance, max(math.ceil(-math.log10(tolerance)), 0)
+
+
+def simplify_feature(feature: dict, zoom: int) -> Optional[dict]:
+    """Return the feature at the level of detail of the zoom, or None if it is smaller than a pixel."""
+    geometry = simplify_geometry(feature.get("geometry"), *level_parameters(zoom))
+    return {**feature, "geometry": geometry} if geometry is not None else None
+
+
+def simplify_layer(layer: dict, zoom: int) -> dict:
+    """Return the layer at the level of detail of the zoom, dropping features smaller than a pixel."""
+    features = (simplify_feature(feature, zoom) for feature in layer.get("features", []))
+    return {**layer, "features": [feature for feature in features if feature is not None]}
+
+
+class LevelOfDetailCache:
+    """LRU cache of simplified layer bytes per layer file, version and zoom level, within a memory budget."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> "LevelOfDetailCache":
+        return cls(max_bytes=int(os.getenv("GEOJSON_LOD_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)))
+
+    def get(self, path: str, stat: os.stat_result, zoom: int) -> bytes:
+        key = (path, zoom)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        with open(path, "rb") as f:
+            layer = json.load(f)
+        content = json.dumps(simplify_layer(layer, zoom), separators=(",", ":")).encode("utf-8")
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= len(previous[1])
+            if len(content) <= self.max_bytes:
+                self._entries[key] = (version, content)
+                self.total_bytes += len(content)
+                while self.total_bytes > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.total_bytes -= len(evicted)
+        return content
@@ -0,0 +1,253 @@
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+
+MAX_ZOOM = 22
+DEFAULT_MAX_TILES = 4096
+# Features are written once per layer version, so each tile body is a join of precomputed fragments
+TILE_PREFIX = b'{"type":"FeatureCollection","features":['
+TILE_SUFFIX = b"]}"
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple:
+    """Return the (min_lon, min_lat, max_lon, max_lat) of a Web Mercator (slippy map) tile."""
+    n = 2 ** z
+    min_lon = x / n * 360.0 - 180.0
+    max_lon = (x + 1) / n * 360.0 - 180.0
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def tile_containing(lon: float, lat: float, z: int) -> tuple:
+    """Return the (x, y) of the tile holding the position at zoom z."""
+    n = 2 ** z
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def coordinate_bounds(coordinates) -> Optional[tuple]:
+    """Bounding box of arbitrarily nested GeoJSON coordinates, or None if there are none."""
+    points = np.asarray(list(_positions(coordinates)), dtype=np.float64).reshape(-1, 2)
+    if not len(points):
+        return None
+    return points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max()
+
+
+def _positions(coordinates):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        yield coordinates[:2]
+        return
+    for item in coordinates or ():
+        yield from _positions(item)
+
+
+def geometry_bounds(geometry: Optional[dict]) -> Optional[tuple]:
+    if not geometry:
+        return None
+    if geometry.get("type") == "Point":
+        # Most layers are points, which skip the generic walk over nested coordinates
+        coordinates = geometry.get("coordinates") or ()
+        if len(coordinates) < 2:
+            return None
+        lon, lat = coordinates[:2]
+        return lon, lat, lon, lat
+    if geometry.get("type") == "GeometryCollection":
+        bounds = [b for b in map(geometry_bounds, geometry.get("geometries", [])) if b is not None]
+        if not bounds:
+            return None
+        bounds = np.asarray(bounds)
+        return bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()
+    return coordinate_bounds(geometry.get("coordinates"))
+
+
+class TileSet:
+    """One version of a layer, with every feature serialized once and indexed by its bounding box."""
+
+    def __init__(self, layer: str, version: str, features: list):
+        self.layer = layer
+        self.version = version
+
+        fragments, bounds = [], []
+        for feature in features:
+            feature_bounds = geometry_bounds(feature.get("geometry"))
+            if feature_bounds is None:
+                continue
+            fragments.append(json.dumps(feature, separators=(",", ":")).encode("utf-8"))
+            bounds.append(feature_bounds)
+
+        self._fragments = fragments
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        self._min_lon, self._min_lat, self._max_lon, self._max_lat = bounds.T
+        self._points = (self._min_lon == self._max_lon) & (self._min_lat == self._max_lat)
+
+    def __len__(self):
+        return len(self._fragments)
+
+    def bounds(self) -> Optional[tuple]:
+        if not len(self):
+            return None
+        return self._min_lon.min(), self._min_lat.min(), self._max_lon.max(), self._max_lat.max()
+
+    def tile(self, z: int, x: int, y: int) -> bytes:
+        """Serialized FeatureCollection of the features intersecting the tile."""
+        min_lon, min_lat, max_lon, max_lat = tile_bounds(z, x, y)
+        # Points use half-open tile edges so a point on a shared edge lands in exactly one tile
+        points = (
+            (self._min_lon >= min_lon) & (self._min_lon < max_lon)
+            & (self._min_lat >= min_lat) & (self._min_lat < max_lat)
+        )
+        shapes = (
+            (self._min_lon <= max_lon) & (self._max_lon >= min_lon)
+            & (self._min_lat <= max_lat) & (self._max_lat >= min_lat)
+        )
+        rows = np.flatnonzero(np.where(self._points, points, shapes))
+        return TILE_PREFIX + b",".join(self._fragments[row] for row in rows) + TILE_SUFFIX
+
+
+class TileCache:
+    """
+    Cuts layers into tiles and caches them in memory (LRU) and on disk, per layer version.
+
+    Layers either come from register() or are looked up through resolve, which maps a layer name to its
+    current version and a loader for its features, or None if the layer does not exist.
+    """
+
+    def __init__(
+        self,
+        resolve: Callable[[str], Optional[tuple]],
+        directory: str,
+        max_tiles: int = DEFAULT_MAX_TILES,
+    ):
+        self.resolve = resolve
+        self.directory = directory
+        self.max_tiles = max_tiles
+        self._registered = {}
+        self._tilesets = {}
+        self._tiles = OrderedDict()
+        self._build_locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_environment(cls, resolve: Callable[[str], Optional[tuple]]) -> "TileCache":
+        return cls(
+            resolve,
+            directory=os.getenv("TILE_CACHE_DIRECTORY", os.path.join(tempfile.gettempdir(), "map_tiles")),
+            max_tiles=int(os.getenv("TILE_CACHE_MAX_TILES", DEFAULT_MAX_TILES)),
+        )
+
+    def register(self, layer: str, version: str, features: list):
+        """Serve an in-memory layer, taking precedence over any layer of the same name that resolve finds."""
+        with self._lock:
+            self._registered[layer] = (version, lambda: features)
+
+    def version(self, layer: str) -> Optional[str]:
+        """Current version of the layer, or None if it does not exist."""
+        source = self._source(layer)
+        return source[0] if source else None
+
+    def tile(self, layer: str, z: int, x: int, y: int) -> Optional[bytes]:
+        """Return the tile's bytes, or None if the layer does not exist."""
+        source = self._source(layer)
+        if source is None:
+            return None
+        version, load = source
+
+        key = (layer, version, z, x, y)
+        with self._lock:
+            content = self._tiles.get(key)
+            if content is not None:
+                self._tiles.move_to_end(key)
+                return content
+
+        path = os.path.join(self.directory, layer, version, str(z), str(x), f"{y}.geojson")
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            content = self._tileset(layer, version, load).tile(z, x, y)
+            self._write(path, content)
+
+        with self._lock:
+            self._tiles[key] = content
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return content
+
+    def seed(self, layer: str, min_zoom: int, max_zoom: int) -> int:
+        """Cut every tile covering the layer's extent at the given zooms ahead of time and return how many."""
+        source = self._source(layer)
+        if source is None:
+            return 0
+        bounds = self._tileset(layer, *source).bounds()
+        if bounds is None:
+            return 0
+
+        count = 0
+        min_lon, min_lat, max_lon, max_lat = bounds
+        for z in range(min_zoom, max_zoom + 1):
+            x0, y0 = tile_containing(min_lon, max_lat, z)
+            x1, y1 = tile_containing(max_lon, min_lat, z)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self.tile(layer, z, x, y)
+                    count += 1
+        return count
+
+    def _source(self, layer: str) -> Optional[tuple]:
+        with self._lock:
+            registered = self._registered.get(layer)
+        return registered if registered is not None else self.resolve(layer)
+
+    def _tileset(self, layer: str, version: str, load: Callable[[], list]) -> TileSet:
+        with self._lock:
+            tileset = self._tilesets.get(layer)
+            if tileset is not None and tileset.version == version:
+                return tileset
+            build_lock = self._build_locks.setdefault(layer, threading.Lock())
+
+        # Built under the layer's own lock so concurrent first requests for a layer only cut it once, while cached
+        # tiles of every layer and builds of other layers carry on
+        with build_lock:
+            with self._lock:
+                tileset = self._tilesets.get(layer)
+            if tileset is not None and tileset.version == version:
+                return tileset
+
+            tileset = TileSet(layer, version, load())
+            self._remove_stale_versions(layer, version)
+            with self._lock:
+                self._tilesets[layer] = tileset
+                self._tiles = OrderedDict((key, value) for key, value in self._tiles.items() if key[0] != layer or key[1] == version)
+            return tileset
+
+    def _remove_stale_versions(self, layer: str, version: str):
+        layer_directory = os.path.join(self.directory, layer)
+        if not os.path.isdir(layer_directory):
+            return
+        for name in os.listdir(layer_directory):
+            if name != version:
+                shutil.rmtree(os.path.join(layer_directory, name), ignore_errors=True)
+
+    def _write(self, path: str, content: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name so a concurrent reader never sees a partial tile
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(content)
+        os.replace(temporary, path)
@@ -2,8 +2,11 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .db.connection import init_db
+from .metrics import MetricsMiddleware, metrics_response
 from .api.query import router as query_router
 from .api.geojson import router as geojson_router
+from .api.tiles import router as tiles_router
+from .api.clusters import router as clusters_router
 
 
 app = FastAPI()
@@ -16,6 +19,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 
 @app.on_event("startup")
@@ -24,13 +28,21 @@ def startup_event():
     init_db()
 
 
-# Attach the existing API routers (query + geojson endpoints).
+# Attach the existing API routers (query + geojson + tile + cluster endpoints).
 app.include_router(query_router)
 app.include_router(query_router)
 app.include_router(geojson_router)
+app.include_router(tiles_router)
+app.include_router(clusters_router)
 
 
 @app.get("/")
 def home():
     # Simple heartbeat endpoint for service health checks.
     return {"message": "hi, City of Edmonton Traffic Volume System is running!"}
+
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus scrape endpoint for request, database and LLM timings.
+    return metrics_response()
@@ -0,0 +1,208 @@
+"""
+In-process request, database and LLM metrics, rendered in the Prometheus text exposition format.
+
+Both FastAPI apps mount MetricsMiddleware and expose metrics_response() at /metrics. Recording a sample takes
+one bisect and one lock, so instrumentation stays cheap on the hot path.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from fastapi.responses import Response
+
+# Seconds, from a cached tile to a slow LLM round trip
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing total per label combination."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}"
+
+
+class Histogram:
+    """Bucketed distribution per label combination, with its sum and count."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Per-bucket counts plus an overflow slot, the sum and the count
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        """Observe the wall-clock duration of the block in seconds, including when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def count(self, *labelvalues) -> int:
+        series = self._series.get(labelvalues)
+        return series[2] if series else 0
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(labelvalues, list(counts), total, count) for labelvalues, (counts, total, count) in self._series.items()]
+        for labelvalues, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{_format_value(float(bound))}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route template", ("method", "route", "status"),
+))
+RESPONSE_BYTES = REGISTRY.register(Histogram(
+    "http_response_size_bytes", "Size of response bodies, by route template", ("method", "route"), SIZE_BUCKETS,
+))
+DB_QUERY_DURATION = REGISTRY.register(Histogram(
+    "db_query_duration_seconds", "Time spent executing database queries", ("operation",),
+))
+POOL_WAIT = REGISTRY.register(Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled database connection",
+))
+LLM_CALL_DURATION = REGISTRY.register(Histogram(
+    "llm_call_duration_seconds", "Time spent waiting on LLM calls", ("operation",),
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "Tokens consumed by LLM calls", ("operation", "kind"),
+))
+ADMISSION_QUEUE_TIME = REGISTRY.register(Histogram(
+    "admission_queue_seconds", "Time requests waited for a slot in their route class", ("route_class",),
+))
+ADMISSION_REJECTIONS = REGISTRY.register(Counter(
+    "admission_rejections_total", "Requests turned away because their route class was saturated", ("route_class", "reason"),
+))
+LLM_COALESCED = REGISTRY.register(Counter(
+    "llm_coalesced_requests_total", "LLM calls saved by sharing an identical in-flight call", ("operation",),
+))
+QUERY_MIRROR_CORRECTIONS = REGISTRY.register(Counter(
+    "llm_mirror_corrections_total", "Queries checked on the SQLite mirror that the database failed to plan",
+))
+
+
+def record_llm_usage(operation: str, messages: Iterable):
+    """Add the input/output token counts reported on LLM response messages (those without usage are skipped)."""
+    for message in messages:
+        usage: Optional[dict] = getattr(message, "usage_metadata", None)
+        if not usage:
+            continue
+        LLM_TOKENS.inc(usage.get("input_tokens", 0), operation, "input")
+        LLM_TOKENS.inc(usage.get("output_tokens", 0), operation, "output")
+
+
+def metrics_response() -> Response:
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency, status and body size of every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # FastAPI records the matched route in the scope; the template keeps the label set bounded
+            route = scope.get("route")
+            template = getattr(route, "path", "unmatched")
+            REQUEST_DURATION.observe(time.perf_counter() - started, scope["method"], template, str(status))
+            RESPONSE_BYTES.observe(size, scope["method"], template)
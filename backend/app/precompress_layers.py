@@ -0,0 +1,39 @@
+"""
+Write a .gz sidecar next to every large GeoJSON layer so /geojson can send it precompressed.
+
+Run from the directory that holds data/ after the layers are regenerated:
+    python -m backend.app.precompress_layers
+"""
+import gzip
+import os
+import shutil
+
+from .api.geojson import BASE, LARGE_LAYER_SIZE
+
+# Only layers /geojson serves straight from disk are sent precompressed
+MIN_SIZE = LARGE_LAYER_SIZE
+
+
+def precompress_layers(directory: str = BASE, min_size: int = MIN_SIZE) -> list:
+    """Compress every stale or missing sidecar in the directory and return the paths written."""
+    written = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.endswith(".geojson") or os.path.getsize(path) <= min_size:
+            continue
+        sidecar = path + ".gz"
+        if os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(path):
+            continue
+
+        # Written under a temporary name so a request never picks up a half-written sidecar
+        temporary = sidecar + ".tmp"
+        with open(path, "rb") as source, gzip.open(temporary, "wb", compresslevel=9) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.replace(temporary, sidecar)
+        written.append(sidecar)
+    return written
+
+
+if __name__ == "__main__":
+    for sidecar in precompress_layers():
+        print(f" wrote {sidecar}")
@@ -0,0 +1,25 @@
+"""
+Cut the tiles of GeoJSON layers ahead of time so the first map views are served from the tile cache.
+
+Run from the directory that holds data/ after the layers are regenerated:
+    python -m backend.app.seed_tiles mv_points_snapped estimation_points_snapped
+"""
+import argparse
+
+from .api.tiles import tile_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("layers", nargs="+")
+    parser.add_argument("--min-zoom", type=int, default=10)
+    parser.add_argument("--max-zoom", type=int, default=16)
+    args = parser.parse_args()
+
+    for layer in args.layers:
+        count = tile_cache.seed(layer, args.min_zoom, args.max_zoom)
+        print(f" {layer}: {count} tiles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Report the cold import time of the API entry points, broken down per imported module.
+
+Each entry point is imported in a fresh interpreter with ``-X importtime``, so nothing is shared with the
+benchmark process or a previous run. Run from the repository root:
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py server --top 30 --repeat 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_MODULES = ["server", "backend.app.main"]
+
+
+def measure(module: str) -> tuple:
+    """Import the module in a new interpreter and return the wall time and the per-module (self, cumulative) times."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Submodules are folded into their top-level package; its cumulative time is that of the package itself
+        name = name.strip()
+        top = name.split(".")[0]
+        entry = modules.setdefault(top, [0, 0])
+        entry[0] += int(self_us)
+        if name == top:
+            entry[1] = max(entry[1], int(cumulative_us))
+    return wall, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report cold import time per module of the API entry points.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=15, help="number of packages to list per entry point")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per entry point; the median is reported")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        runs = [measure(module) for _ in range(args.repeat)]
+        walls = [wall for wall, _ in runs]
+        # The package breakdown is taken from the run closest to the median wall time
+        median_run = min(runs, key=lambda run: abs(run[0] - statistics.median(walls)))
+        packages = sorted(median_run[1].items(), key=lambda item: item[1][0], reverse=True)
+
+        print(f"{module}: {statistics.median(walls) * 1000:.0f} ms median wall time over {args.repeat} runs "
+              f"(min {min(walls) * 1000:.0f} ms, max {max(walls) * 1000:.0f} ms)")
+        print(f"  {'package':<32}{'self ms':>10}{'cumulative ms':>16}")
+        for name, (self_us, cumulative_us) in packages[:args.top]:
+            print(f"  {name:<32}{self_us / 1000:>10.1f}{cumulative_us / 1000:>16.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""
+Replay map traffic against both API apps and report throughput and latency percentiles per route.
+
+backend/app/main.py and server.py are started in-process with uvicorn on local ports. Both use a scratch Postgres
+database, given explicitly and never taken from DATABASE_URL, seeded with synthetic studies in a ``load_test``
+schema that is dropped and recreated on every run, and GeoJSON layers generated into a scratch directory. Workers
+then send a weighted mix of the requests MapView.jsx makes: layers, levels of detail, tiles, clusters and
+/query/studies with varying years, directions and viewports, plus CSV exports.
+
+    python benchmarks/load_test.py --database-url postgresql://localhost/traffic
+    python benchmarks/load_test.py --duration 60 --concurrency 32 --update-baseline
+
+Results are written to --output. If a baseline exists, each route's p95 is compared against it, and
+--update-baseline replaces the baseline with this run so the change shows up in review.
+"""
+import argparse
+import datetime
+import getpass
+import http.client
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCHMARKS = Path(__file__).resolve().parent
+SCHEMA = "load_test"
+DIRECTIONS = ["Northbound", "Southbound", "Eastbound", "Westbound"]
+# Roughly the City of Edmonton
+CITY_BBOX = (-113.72, 53.40, -113.27, 53.66)
+BACKEND_PORT = 8101
+SERVER_PORT = 8102
+
+
+def with_search_path(url: str, schema: str) -> str:
+    """Point every connection made with the URL at the schema, so the seeded tables never touch real data."""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query["options"] = f"-csearch_path={schema}"
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def database_identity(dsn: str) -> tuple:
+    """Host, port and database a DSN connects to, with the defaults filled in, so differently written DSNs compare equal."""
+    from psycopg2.extensions import parse_dsn
+
+    parameters = parse_dsn(dsn)
+    host = parameters.get("host") or "localhost"
+    # A socket directory and the loopback addresses all reach the local server
+    if host.startswith("/") or host in ("127.0.0.1", "::1"):
+        host = "localhost"
+    user = parameters.get("user") or os.getenv("PGUSER") or getpass.getuser()
+    return host.lower(), str(parameters.get("port") or 5432), parameters.get("dbname") or user
+
+
+def seed_database(url: str, studies: int, rng: random.Random):
+    """Recreate the studies tables of Schema Version 3 in the load test schema and fill them with synthetic rows."""
+    import psycopg2
+    from psycopg2.extras import execute_values
+
+    connection = psycopg2.connect(url)
+    cursor = connection.cursor()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA};")
+    cursor.execute(f"SET search_path TO {SCHEMA};")
+    cursor.execute("""
+                   CREATE TABLE studies(
+                       miovision_id INTEGER PRIMARY KEY,
+                       study_name VARCHAR(100) NOT NULL,
+                       study_duration DECIMAL NOT NULL,
+                       study_type VARCHAR(100) NOT NULL,
+                       location_name VARCHAR(100) NOT NULL,
+                       latitude DECIMAL NOT NULL,
+                       longitude DECIMAL NOT NULL,
+                       project_name VARCHAR(100),
+                       study_date DATE NOT NULL
+                   );
+                   CREATE TABLE direction_types(
+                       id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+                       direction_name VARCHAR(20) NOT NULL
+                   );
+                   CREATE TABLE studies_directions(
+                       id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+                       miovision_id INTEGER REFERENCES studies(miovision_id),
+                       direction_type_id INTEGER REFERENCES direction_types(id)
+                   );
+                   """)
+    execute_values(cursor, "INSERT INTO direction_types (direction_name) VALUES %s;", [(name,) for name in DIRECTIONS])
+
+    min_lon, min_lat, max_lon, max_lat = CITY_BBOX
+    rows, directions = [], []
+    for miovision_id in range(1, studies + 1):
+        study_date = datetime.date(rng.randint(2010, 2024), rng.randint(1, 12), rng.randint(1, 28))
+        rows.append((
+            miovision_id, f"Study {miovision_id}", 24, "TMC", f"Location {miovision_id}",
+            rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon), None, study_date,
+        ))
+        for direction_id in rng.sample(range(1, len(DIRECTIONS) + 1), rng.randint(1, len(DIRECTIONS))):
+            directions.append((miovision_id, direction_id))
+    execute_values(cursor, "INSERT INTO studies VALUES %s;", rows, page_size=5000)
+    execute_values(cursor, "INSERT INTO studies_directions (miovision_id, direction_type_id) VALUES %s;", directions, page_size=5000)
+
+    # The same indexes and data version as create_indexes and bump_data_version in database_connection.py
+    cursor.execute("""
+                   CREATE INDEX studies_study_date_idx ON studies (study_date);
+                   CREATE INDEX studies_directions_miovision_direction_idx ON studies_directions (miovision_id, direction_type_id);
+                   CREATE INDEX direction_types_lower_name_idx ON direction_types (lower(direction_name));
+                   CREATE TABLE data_version(
+                       id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                       version INTEGER NOT NULL,
+                       updated_at TIMESTAMP NOT NULL DEFAULT now()
+                   );
+                   INSERT INTO data_version (version) VALUES (1);
+                   ANALYZE;
+                   """)
+    connection.commit()
+    connection.close()
+
+
+def write_layers(directory: Path, rng: random.Random, roads: int, stations: int):
+    """Write a line layer and a point layer shaped like the road segments and count stations the map shows."""
+    directory.mkdir(parents=True, exist_ok=True)
+    min_lon, min_lat, max_lon, max_lat = CITY_BBOX
+
+    segments = []
+    for index in range(roads):
+        lon, lat = rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat)
+        coordinates = []
+        for _ in range(rng.randint(20, 200)):
+            lon += rng.uniform(-1, 1) * 2e-4
+            lat += rng.uniform(-1, 1) * 2e-4
+            coordinates.append([lon, lat])
+        segments.append({
+            "type": "Feature",
+            "properties": {"id": f"RD-{index}", "year": rng.randint(2010, 2024)},
+            "geometry": {"type": "LineString", "coordinates": coordinates},
+        })
+
+    points = [
+        {
+            "type": "Feature",
+            "properties": {"id": f"CS-{index}"},
+            "geometry": {"type": "Point", "coordinates": [rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat)]},
+        }
+        for index in range(stations)
+    ]
+
+    for name, features in (("roads", segments), ("count_stations", points)):
+        with open(directory / f"{name}.geojson", "w") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, separators=(",", ":"))
+
+
+def start_server(app, port: int):
+    """Serve the app with uvicorn on a daemon thread and wait until it accepts connections."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError(f"server on port {port} failed to start")
+        time.sleep(0.05)
+    return server
+
+
+def tile_for(lon: float, lat: float, zoom: int) -> tuple:
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return x, y
+
+
+def random_viewport(rng: random.Random, zoom: int) -> tuple:
+    """A viewport about 1200x800 px wide at the zoom, centred somewhere in the city."""
+    min_lon, min_lat, max_lon, max_lat = CITY_BBOX
+    lon, lat = rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat)
+    width = 1200 * 360.0 / (256 * 2 ** zoom)
+    height = width * 800 / 1200 * math.cos(math.radians(lat))
+    return (lon - width / 2, lat - height / 2, lon + width / 2, lat + height / 2)
+
+
+def bbox_param(bbox: tuple) -> str:
+    return ",".join(f"{value:.6f}" for value in bbox)
+
+
+def studies_request(rng: random.Random):
+    start_year = rng.randint(2010, 2024)
+    params = {"start_year": start_year, "end_year": rng.randint(start_year, 2024)}
+    if rng.random() < 0.5:
+        params["direction"] = rng.choice(DIRECTIONS)
+    if rng.random() < 0.8:
+        # Once the user has filtered, every pan or zoom refetches the studies of the viewport
+        params["bbox"] = bbox_param(random_viewport(rng, rng.randint(11, 16)))
+    return SERVER_PORT, "GET", f"/query/studies?{urlencode(params)}", None
+
+
+def tile_request(rng: random.Random):
+    # The map switches from clusters to point tiles once zoomed in past the highest cluster zoom
+    zoom = rng.randint(17, 18)
+    lon, lat = rng.uniform(CITY_BBOX[0], CITY_BBOX[2]), rng.uniform(CITY_BBOX[1], CITY_BBOX[3])
+    x, y = tile_for(lon, lat, zoom)
+    return BACKEND_PORT, "GET", f"/tiles/count_stations/{zoom}/{x}/{y}", None
+
+
+def clusters_request(rng: random.Random):
+    zoom = rng.randint(10, 16)
+    params = urlencode({"zoom": zoom, "bbox": bbox_param(random_viewport(rng, zoom))})
+    return BACKEND_PORT, "GET", f"/clusters/count_stations?{params}", None
+
+
+def export_request(rng: random.Random):
+    start_year = rng.randint(2010, 2024)
+    query = (
+        "SELECT miovision_id, study_name, study_date, latitude, longitude FROM studies "
+        f"WHERE study_date >= '{start_year}-01-01'"
+    )
+    return SERVER_PORT, "POST", "/export?format=csv", json.dumps({"prompt": query})
+
+
+# Route label, relative weight and request factory, weighted towards what a map session sends most
+SCENARIOS = [
+    ("GET /query/studies", 30, studies_request),
+    ("GET /clusters/{layer}", 20, clusters_request),
+    ("GET /tiles/{layer}/{z}/{x}/{y}", 20, tile_request),
+    ("GET /geojson/mv_points_snapped", 8, lambda rng: (SERVER_PORT, "GET", "/geojson/mv_points_snapped", None)),
+    ("GET /geojson/estimation_points_snapped", 8, lambda rng: (SERVER_PORT, "GET", "/geojson/estimation_points_snapped", None)),
+    ("GET /geojson/{layer}?zoom", 6, lambda rng: (BACKEND_PORT, "GET", f"/geojson/roads?zoom={rng.randint(10, 14)}", None)),
+    ("GET /geojson/{layer}?bbox", 5, lambda rng: (BACKEND_PORT, "GET", f"/geojson/roads?bbox={bbox_param(random_viewport(rng, 14))}", None)),
+    ("POST /export csv", 3, export_request),
+]
+
+
+def run_worker(deadline: float, seed: int, samples: list, record: bool):
+    rng = random.Random(seed)
+    labels = [label for label, _, _ in SCENARIOS]
+    weights = [weight for _, weight, _ in SCENARIOS]
+    factories = dict((label, factory) for label, _, factory in SCENARIOS)
+    connections = {}
+
+    while time.monotonic() < deadline:
+        label = rng.choices(labels, weights)[0]
+        port, method, path, body = factories[label](rng)
+        headers = {"Content-Type": "application/json"} if body else {}
+
+        started = time.perf_counter()
+        try:
+            connection = connections.get(port)
+            if connection is None:
+                connection = connections[port] = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            size = len(response.read())
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            # The connection is dropped and reopened by the next request to the port
+            connections.pop(port, None)
+            size, status = 0, 0
+        if record:
+            samples.append((label, time.perf_counter() - started, status, size))
+
+    for connection in connections.values():
+        connection.close()
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def summarize(samples: list, duration: float) -> dict:
+    routes = {}
+    for label in sorted({sample[0] for sample in samples}):
+        latencies = sorted(latency for sample_label, latency, _, _ in samples if sample_label == label)
+        errors = sum(1 for sample_label, _, status, _ in samples if sample_label == label and not 200 <= status < 400)
+        sizes = [size for sample_label, _, _, size in samples if sample_label == label]
+        routes[label] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "throughput_rps": round(len(latencies) / duration, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "mean_bytes": round(sum(sizes) / len(sizes)),
+        }
+    return {
+        "total_requests": len(samples),
+        "throughput_rps": round(len(samples) / duration, 2),
+        "routes": routes,
+    }
+
+
+def print_report(summary: dict, baseline: dict):
+    print(f"\n{summary['total_requests']} requests, {summary['throughput_rps']} req/s overall")
+    print(f"{'route':<42}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'p95 vs baseline':>18}")
+    baseline_routes = (baseline or {}).get("summary", {}).get("routes", {})
+    for label, route in summary["routes"].items():
+        change = ""
+        previous = baseline_routes.get(label)
+        if previous and previous["p95_ms"]:
+            change = f"{(route['p95_ms'] / previous['p95_ms'] - 1) * 100:+.0f}%"
+        print(
+            f"{label:<42}{route['throughput_rps']:>9}{route['p50_ms']:>10}{route['p95_ms']:>10}"
+            f"{route['p99_ms']:>10}{route['errors']:>8}{change:>18}"
+        )
+
+
+def main():
+    from dotenv import load_dotenv
+
+    # The application's DATABASE_URL usually only lives in .env, and the guard below has to see it
+    load_dotenv(ROOT / ".env")
+    parser = argparse.ArgumentParser(description="Load test the map and query endpoints of both API apps.")
+    # Never DATABASE_URL: seeding drops and recreates the load_test schema, which must not happen on the hosted database
+    parser.add_argument("--database-url", default=os.getenv("LOAD_TEST_DATABASE_URL"),
+                        help="scratch Postgres to seed; the load_test schema is dropped and recreated")
+    parser.add_argument("--studies", type=int, default=20000)
+    parser.add_argument("--roads", type=int, default=2000)
+    parser.add_argument("--stations", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of recorded traffic")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of unrecorded traffic to fill the caches")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, default=BENCHMARKS / "load_test_results.json")
+    parser.add_argument("--baseline", type=Path, default=BENCHMARKS / "load_test_baseline.json")
+    parser.add_argument("--update-baseline", action="store_true", help="save this run as the new baseline")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url (or LOAD_TEST_DATABASE_URL) is required")
+    application_url = os.getenv("DATABASE_URL")
+    if application_url and database_identity(args.database_url) == database_identity(application_url):
+        parser.error("--database-url is the application's DATABASE_URL; point the load test at a scratch database")
+
+    rng = random.Random(args.seed)
+    print(f"Seeding {args.studies} studies into the {SCHEMA} schema")
+    seed_database(args.database_url, args.studies, rng)
+
+    scratch = Path(tempfile.mkdtemp(prefix="load_test_"))
+    write_layers(scratch / "data", rng, args.roads, args.stations)
+
+    # Both apps read their configuration at import, and the backend resolves layers relative to the working directory
+    os.environ["DATABASE_URL"] = with_search_path(args.database_url, SCHEMA)
+    os.environ["EXPORT_RESULT_DIRECTORY"] = str(scratch / "exports")
+    os.environ["TILE_CACHE_DIRECTORY"] = str(scratch / "tiles")
+    os.chdir(scratch)
+    sys.path.insert(0, str(ROOT))
+    from backend.app.main import app as backend_app
+    from server import app as server_app
+
+    servers = [start_server(backend_app, BACKEND_PORT), start_server(server_app, SERVER_PORT)]
+    try:
+        for phase, seconds, record in (("warm-up", args.warmup, False), ("recorded", args.duration, True)):
+            print(f"Running {seconds:g}s {phase} traffic with {args.concurrency} concurrent users")
+            samples = []
+            deadline = time.monotonic() + seconds
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                for worker in range(args.concurrency):
+                    executor.submit(run_worker, deadline, args.seed * 1000 + worker, samples, record)
+    finally:
+        for server in servers:
+            server.should_exit = True
+
+    summary = summarize(samples, args.duration)
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else None
+    print_report(summary, baseline)
+
+    result = {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "studies": args.studies,
+            "roads": args.roads,
+            "stations": args.stations,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "seed": args.seed,
+        },
+        "summary": summary,
+    }
+    args.output.write_text(json.dumps(result, indent=2) + "\n")
+    print(f"\nResults written to {args.output}")
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"Baseline updated at {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
 from .database_chat_integration import SQLAgent
+from .query_guardrails import MultipleStatementsError, QueryEstimate, QueryGuardrails, QueryRejectedError
+from .result_pages import DEFAULT_PAGE_SIZE, InvalidContinuationTokenError, ResultPage, infer_column_types
 
-__all__ = ['SQLAgent']
\ No newline at end of file
+__all__ = ['SQLAgent', 'MultipleStatementsError', 'QueryEstimate', 'QueryGuardrails', 'QueryRejectedError',
+           'DEFAULT_PAGE_SIZE', 'InvalidContinuationTokenError', 'ResultPage', 'infer_column_types']
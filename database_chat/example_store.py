@@ -0,0 +1,177 @@
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from typing import NamedTuple, Optional
+from .query_guardrails import MultipleStatementsError, single_statement
+from .single_flight import normalize_prompt
+
+DEFAULT_STORE_PATH = os.path.join(tempfile.gettempdir(),'coe_query_examples.jsonl')
+DEFAULT_MAX_EXAMPLES = 500
+DEFAULT_TOP_K = 3
+# Examples end up in every later user's system prompt, so each one is kept short
+MAX_PROMPT_CHARACTERS = 500
+MAX_QUERY_CHARACTERS = 4000
+
+# Standard Okapi BM25 parameters
+_K1 = 1.5
+_B = 0.75
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+# Words every prompt shares carry no signal about which tables or filters it needs
+_STOP_WORDS = frozenset((
+    'a', 'about', 'all', 'an', 'and', 'are', 'as', 'at', 'by', 'data', 'do', 'for', 'from', 'get', 'give', 'how',
+    'i', 'in', 'is', 'it', 'list', 'me', 'of', 'on', 'or', 'please', 'show', 'that', 'the', 'to', 'want', 'what',
+    'which', 'with',
+))
+
+class Example(NamedTuple):
+    prompt: str
+    query: str
+
+def tokenize(text:str)->list[str]:
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOP_WORDS]
+
+def admissible_example(prompt:str,query:str)->Optional[Example]:
+    """
+    Return the example as it may be stored, with the prompt truncated, or ``None`` if the query is not a single
+    ``SELECT`` statement within ``MAX_QUERY_CHARACTERS``. Long queries are dropped rather than cut, as a truncated
+    query would be a broken example.
+    """
+    try:
+        statement = single_statement(query)
+    except MultipleStatementsError:
+        return None
+    if len(statement) > MAX_QUERY_CHARACTERS or not re.match(r'select\b',statement,re.IGNORECASE):
+        return None
+    return Example(prompt=' '.join(prompt.split())[:MAX_PROMPT_CHARACTERS],query=statement + ';')
+
+class ExampleStore:
+    """
+    Prompts whose generated SQL was exported successfully, ranked against new prompts with BM25 so the closest ones
+    can be shown to the agent as worked examples. Examples are appended to a local JSON lines file and the index is
+    kept in memory, so no external service is involved.
+    """
+    def __init__(self,path:Optional[str]=DEFAULT_STORE_PATH,max_examples:int=DEFAULT_MAX_EXAMPLES):
+        self.path = path
+        self.max_examples = max_examples
+
+        # Keyed by normalized prompt, oldest first, so a prompt answered again replaces its previous query
+        self.__examples: OrderedDict[str,Example] = OrderedDict()
+        self.__term_counts: dict[str,Counter] = {}
+        self.__document_frequencies = Counter()
+        self.__total_length = 0
+        self.__lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            self.__load()
+
+    @classmethod
+    def from_environment(cls)->'ExampleStore':
+        """
+        Create the store from the ``QUERY_EXAMPLES_PATH`` and ``QUERY_EXAMPLES_MAX`` environment variables, falling back
+        to the defaults for any that are not set. An empty path keeps the examples in memory only.
+        """
+        return cls(
+            path=os.getenv("QUERY_EXAMPLES_PATH",DEFAULT_STORE_PATH) or None,
+            max_examples=int(os.getenv("QUERY_EXAMPLES_MAX",DEFAULT_MAX_EXAMPLES))
+        )
+
+    def __len__(self)->int:
+        return len(self.__examples)
+
+    def add(self,prompt:str,query:str)->bool:
+        """
+        Store the prompt with the query that answered it, evicting the oldest example once the store is full.
+
+        ### Returns
+        ``False`` if the example was not admissible and was not stored, see ``admissible_example``.
+
+        ### Effects
+        Appends the example to the store file.
+        """
+        example = admissible_example(prompt,query)
+        if example is None:
+            return False
+        with self.__lock:
+            self.__insert(example)
+            if self.path:
+                with open(self.path,'a',encoding='utf-8') as f:
+                    f.write(json.dumps(example._asdict()) + '\n')
+        return True
+
+    def search(self,prompt:str,top_k:int=DEFAULT_TOP_K)->list[Example]:
+        """
+        Return up to top_k stored examples most similar to the prompt, best first. Examples sharing no term with the
+        prompt are never returned.
+        """
+        terms = set(tokenize(prompt))
+        with self.__lock:
+            count = len(self.__examples)
+            if not count or not terms:
+                return []
+            average_length = self.__total_length / count
+
+            scores = []
+            for key, term_counts in self.__term_counts.items():
+                length = sum(term_counts.values())
+                score = 0.0
+                for term in terms:
+                    frequency = term_counts.get(term)
+                    if not frequency:
+                        continue
+                    document_frequency = self.__document_frequencies[term]
+                    idf = math.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5))
+                    score += idf * frequency * (_K1 + 1) / (frequency + _K1 * (1 - _B + _B * length / average_length))
+                if score > 0:
+                    scores.append((score,key))
+
+            scores.sort(reverse=True)
+            return [self.__examples[key] for _, key in scores[:top_k]]
+
+    def __insert(self,example:Example)->None:
+        key = normalize_prompt(example.prompt)
+        if key in self.__examples:
+            self.__remove(key)
+        self.__examples[key] = example
+        term_counts = Counter(tokenize(example.prompt))
+        self.__term_counts[key] = term_counts
+        self.__document_frequencies.update(term_counts.keys())
+        self.__total_length += sum(term_counts.values())
+
+        while len(self.__examples) > self.max_examples:
+            self.__remove(next(iter(self.__examples)))
+
+    def __remove(self,key:str)->None:
+        del self.__examples[key]
+        term_counts = self.__term_counts.pop(key)
+        for term in term_counts:
+            self.__document_frequencies[term] -= 1
+            if not self.__document_frequencies[term]:
+                del self.__document_frequencies[term]
+        self.__total_length -= sum(term_counts.values())
+
+    def __load(self)->None:
+        lines = 0
+        with open(self.path,encoding='utf-8') as f:
+            for line in f:
+                lines += 1
+                try:
+                    record = json.loads(line)
+                    example = admissible_example(record['prompt'],record['query'])
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    # A line cut short by a crash mid-write is skipped rather than losing the whole store
+                    continue
+                # Examples stored before the current limits applied are dropped
+                if example is not None:
+                    self.__insert(example)
+
+        # Replaced and evicted examples are only dropped from the file when it is rewritten here
+        if lines > len(self.__examples):
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path,'w',encoding='utf-8') as f:
+                for example in self.__examples.values():
+                    f.write(json.dumps(example._asdict()) + '\n')
+            os.replace(temporary_path,self.path)
@@ -0,0 +1,228 @@
+import os
+import re
+from typing import NamedTuple
+
+DEFAULT_STATEMENT_TIMEOUT_MS = 30_000
+DEFAULT_MAX_COST = 5_000_000.0
+DEFAULT_MAX_ROWS = 2_000_000
+
+_DOLLAR_QUOTE = re.compile(r'\$([A-Za-z_][A-Za-z0-9_]*)?\$')
+_IDENTIFIER_CHARACTERS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$')
+
+class QueryEstimate(NamedTuple):
+    cost: float
+    rows: int
+
+class QueryRejectedError(Exception):
+    """
+    Raised when the planner estimate of a query is above the configured thresholds.
+
+    ### Attributes
+    1. action : ``str``
+        - ``reject`` if the query is too expensive to run at all, ``paginate`` if it is cheap enough but returns too
+          many rows to be exported in one go.
+    2. estimate : ``QueryEstimate``
+        - Planner estimate of the total cost and number of rows.
+    3. max_cost : ``float``
+        - Cost threshold that was applied.
+    4. max_rows : ``int``
+        - Row threshold that was applied.
+    """
+    def __init__(self,action:str,estimate:QueryEstimate,max_cost:float,max_rows:int):
+        self.action = action
+        self.estimate = estimate
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+
+        if action == 'reject':
+            message = f"Query rejected, estimated cost {estimate.cost:.0f} is above the limit of {max_cost:.0f}"
+        else:
+            message = f"Query returns an estimated {estimate.rows} rows, above the limit of {max_rows}. Paginate the results instead"
+        super().__init__(message)
+
+class MultipleStatementsError(ValueError):
+    """
+    Raised when a query holds more than one SQL statement, or none. psycopg2 runs every statement of a string, so a
+    second statement could end the read-only transaction and modify the database.
+    """
+
+def split_statements(query:str)->list[str]:
+    """
+    Split the SQL text on the semicolons that end statements, skipping those inside string literals, quoted
+    identifiers, dollar-quoted strings and comments.
+
+    ### Parameters
+    1. query : ``str``
+        - SQL text, possibly holding several statements.
+
+    ### Returns
+    The ``list[str]`` of statements without their terminating semicolons. Statements holding nothing but whitespace
+    and comments are left out.
+    """
+    statements = []
+    start = 0
+    has_content = False
+    index = 0
+    length = len(query)
+
+    while index < length:
+        character = query[index]
+        if query.startswith('--',index):
+            newline = query.find('\n',index)
+            index = length if newline == -1 else newline + 1
+            continue
+        if query.startswith('/*',index):
+            # Block comments nest in Postgres
+            depth = 1
+            index += 2
+            while index < length and depth:
+                if query.startswith('/*',index):
+                    depth += 1
+                    index += 2
+                elif query.startswith('*/',index):
+                    depth -= 1
+                    index += 2
+                else:
+                    index += 1
+            continue
+        if character.isspace():
+            index += 1
+            continue
+
+        if character == ';':
+            if has_content:
+                statements.append(query[start:index].strip())
+            start = index + 1
+            has_content = False
+            index += 1
+            continue
+
+        has_content = True
+        if character in ("'",'"'):
+            # Backslashes only escape in E'' strings, doubled quotes close nothing in either kind
+            escapes = character == "'" and index > 0 and query[index - 1] in 'eE' and (
+                index < 2 or query[index - 2] not in _IDENTIFIER_CHARACTERS
+            )
+            index += 1
+            while index < length:
+                if escapes and query[index] == '\\':
+                    index += 2
+                elif query[index] == character:
+                    if query.startswith(character * 2,index):
+                        index += 2
+                    else:
+                        break
+                else:
+                    index += 1
+            index += 1
+            continue
+        if character == '$' and (index == 0 or query[index - 1] not in _IDENTIFIER_CHARACTERS):
+            match = _DOLLAR_QUOTE.match(query,index)
+            if match:
+                end = query.find(match.group(0),match.end())
+                index = length if end == -1 else end + len(match.group(0))
+                continue
+        index += 1
+
+    if has_content:
+        statements.append(query[start:].strip())
+    return statements
+
+def single_statement(query:str)->str:
+    """
+    Return the only statement of the query, without its terminating semicolon.
+
+    ### Raises
+    ``MultipleStatementsError`` if the query does not hold exactly one statement.
+    """
+    statements = split_statements(query)
+    if len(statements) != 1:
+        raise MultipleStatementsError(f"Query must hold exactly one SQL statement, found {len(statements)}")
+    return statements[0]
+
+class QueryGuardrails:
+    """
+    Limits applied to every query that is run on behalf of a user. Queries must be a single statement, run on a
+    read-only session inside a read-only transaction with a statement timeout, and are only admitted after an
+    ``EXPLAIN`` estimate is within the thresholds.
+    """
+    def __init__(self,statement_timeout_ms:int=DEFAULT_STATEMENT_TIMEOUT_MS,max_cost:float=DEFAULT_MAX_COST,max_rows:int=DEFAULT_MAX_ROWS):
+        self.statement_timeout_ms = statement_timeout_ms
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+
+    @classmethod
+    def from_environment(cls)->'QueryGuardrails':
+        """
+        Create the guardrails from the ``QUERY_STATEMENT_TIMEOUT_MS``, ``QUERY_MAX_COST`` and ``QUERY_MAX_ROWS``
+        environment variables, falling back to the defaults for any that are not set.
+        """
+        return cls(
+            statement_timeout_ms=int(os.getenv("QUERY_STATEMENT_TIMEOUT_MS",DEFAULT_STATEMENT_TIMEOUT_MS)),
+            max_cost=float(os.getenv("QUERY_MAX_COST",DEFAULT_MAX_COST)),
+            max_rows=int(os.getenv("QUERY_MAX_ROWS",DEFAULT_MAX_ROWS))
+        )
+
+    def begin(self,cursor)->None:
+        """
+        Make the current transaction read-only and bound the run time of its statements.
+
+        ### Parameters
+        1. cursor : An instance of the psycopg2 Cursor class
+            - Cursor of a connection that has no statements in its current transaction yet.
+
+        ### Effects
+        The remainder of the transaction cannot modify the database, and statements are cancelled once they exceed
+        the statement timeout. Connections from ``get_pool(dsn, read_only=True)`` are also read-only for the whole
+        session, which a ``COMMIT`` cannot end.
+        """
+        cursor.execute("SET TRANSACTION READ ONLY;")
+        cursor.execute("SET LOCAL statement_timeout = %s;",(self.statement_timeout_ms,))
+
+    def estimate(self,cursor,query:str)->QueryEstimate:
+        """
+        Return the planner estimate for the query without running it.
+
+        ### Parameters
+        1. cursor : An instance of the psycopg2 Cursor class
+            - Used to run the ``EXPLAIN`` statement.
+        2. query : ``str``
+            - Query to be estimated.
+
+        ### Returns
+        A ``QueryEstimate`` containing the total cost and number of rows.
+
+        ### Raises
+        ``MultipleStatementsError`` if the query does not hold exactly one statement, in which case nothing is run.
+        """
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {single_statement(query)}")
+        plan = cursor.fetchone()[0][0]['Plan']
+        return QueryEstimate(cost=float(plan['Total Cost']),rows=int(plan['Plan Rows']))
+
+    def admit(self,cursor,query:str,allow_pagination:bool=False)->QueryEstimate:
+        """
+        Check the planner estimate for the query against the thresholds.
+
+        ### Parameters
+        1. cursor : An instance of the psycopg2 Cursor class
+            - Used to run the ``EXPLAIN`` statement.
+        2. query : ``str``
+            - Query to be checked.
+        3. allow_pagination : ``bool``
+            - Skip the row threshold, used when the caller only fetches the result a page at a time.
+
+        ### Returns
+        The ``QueryEstimate`` of the admitted query.
+
+        ### Raises
+        ``QueryRejectedError`` if the query is above a threshold, and ``MultipleStatementsError`` if it does not hold
+        exactly one statement.
+        """
+        estimate = self.estimate(cursor=cursor,query=query)
+
+        if estimate.cost > self.max_cost:
+            raise QueryRejectedError(action='reject',estimate=estimate,max_cost=self.max_cost,max_rows=self.max_rows)
+        if estimate.rows > self.max_rows and not allow_pagination:
+            raise QueryRejectedError(action='paginate',estimate=estimate,max_cost=self.max_cost,max_rows=self.max_rows)
+
+        return estimate
@@ -0,0 +1,118 @@
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+from typing import Any, NamedTuple, Optional
+from .query_guardrails import single_statement
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+class ResultPage(NamedTuple):
+    columns: list[str]
+    rows: list[tuple]
+    continuation_token: Optional[str]
+    estimated_total_rows: int
+
+class InvalidContinuationTokenError(ValueError):
+    """
+    Raised when a continuation token is malformed or was issued for a different query.
+    """
+
+# Checked in order, since bool is a subclass of int and datetime of date
+_COLUMN_TYPES = [
+    (bool, 'boolean'),
+    (int, 'integer'),
+    ((float, decimal.Decimal), 'number'),
+    (datetime.datetime, 'datetime'),
+    (datetime.date, 'date'),
+    (datetime.time, 'time'),
+]
+
+def strip_statement(query:str)->str:
+    """
+    Remove the trailing semicolon the LLM adds to its queries, so the query can be nested as a subquery.
+    """
+    return query.strip().rstrip(';').strip()
+
+def build_page_query(query:str)->str:
+    """
+    Wrap the query so it returns one page of its result, in the order the query itself defines.
+
+    The page is cut with ``LIMIT`` and ``OFFSET`` around the query, so a query ending in ``ORDER BY`` keeps its order
+    and its duplicate rows, and the planner can stop after offset plus page_size rows instead of producing the whole
+    result. The first page, which previews always ask for, is a plain top-N over the query. Deep pages still cost
+    O(offset), as the skipped rows are produced and discarded on every request.
+
+    ### Parameters
+    1. query : ``str``
+        - Query holding a single statement, with or without a trailing semicolon.
+
+    ### Returns
+    The page query as a ``str``, taking the limit and the offset as parameters.
+
+    ### Raises
+    ``MultipleStatementsError`` if the query does not hold exactly one statement.
+    """
+    # The query is not a psycopg2 template, so any literal percent signs have to be escaped
+    query = single_statement(query).replace('%','%%')
+    # The closing parenthesis goes on its own line so a trailing line comment in the query cannot swallow it
+    return f"""
+            SELECT page.*
+            FROM (
+            {query}
+            ) AS page
+            LIMIT %s OFFSET %s;
+            """
+
+def encode_continuation_token(query:str,offset:int)->str:
+    """
+    Create the token used to request the page starting at the given row offset.
+    """
+    payload = json.dumps({'q': _query_fingerprint(query), 'o': offset})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_continuation_token(query:str,token:str)->int:
+    """
+    Return the row offset stored in the token.
+
+    ### Raises
+    ``InvalidContinuationTokenError`` if the token is malformed or belongs to a different query.
+    """
+    try:
+        payload: dict[str,Any] = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        fingerprint, offset = payload['q'], payload['o']
+    except (ValueError, KeyError, TypeError) as exc:
+        raise InvalidContinuationTokenError("Malformed continuation token") from exc
+
+    if fingerprint != _query_fingerprint(query):
+        raise InvalidContinuationTokenError("Continuation token was issued for a different query")
+    if not isinstance(offset,int) or isinstance(offset,bool) or offset < 0:
+        raise InvalidContinuationTokenError("Malformed continuation token")
+    return offset
+
+def _query_fingerprint(query:str)->str:
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()[:16]
+
+def infer_column_types(rows:list[tuple],column_count:int)->list[str]:
+    """
+    Name the JSON type of every column from its first non-null value, so clients can restore the values that JSON
+    carries as strings or floats.
+
+    ### Parameters
+    1. rows : ``list[tuple]``
+        - Rows of the page.
+    2. column_count : ``int``
+        - Number of columns, used when the page is empty.
+
+    ### Returns
+    A ``list[str]`` holding one of ``boolean``, ``integer``, ``number``, ``datetime``, ``date``, ``time`` or
+    ``string`` per column, ``string`` being used for columns that are empty or null throughout.
+    """
+    column_types = []
+    for index in range(column_count):
+        value = next((row[index] for row in rows if row[index] is not None),None)
+        column_type = next((name for kind,name in _COLUMN_TYPES if isinstance(value,kind)),'string')
+        column_types.append(column_type)
+    return column_types
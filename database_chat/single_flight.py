@@ -0,0 +1,60 @@
+import threading
+from typing import Any, Callable, Hashable
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key, so only the first runs and the others wait for and share its
+    result, or its exception. Nothing is cached: once the call finishes, the next one with the key runs again.
+    """
+    def __init__(self):
+        self.__calls: dict[Hashable,_Call] = {}
+        self.__lock = threading.Lock()
+
+    def do(self,key:Hashable,function:Callable[[],Any])->tuple[Any,bool]:
+        """
+        Run the function unless a call with the same key is already in flight, in which case wait for that call.
+
+        ### Parameters
+        1. key : ``Hashable``
+            - Identifies calls that are interchangeable.
+        2. function : ``Callable[[], Any]``
+            - Computation run by the first caller.
+
+        ### Returns
+        A ``tuple`` of the result and whether it was shared from another caller's computation.
+        """
+        with self.__lock:
+            call = self.__calls.get(key)
+            shared = call is not None
+            if not shared:
+                call = self.__calls[key] = _Call()
+
+        if shared:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.done.set()
+        return call.result, False
+
+def normalize_prompt(prompt:str)->str:
+    """
+    Collapse the whitespace differences that do not change what a prompt asks for. Case is kept, as it can matter
+    to the filters, e.g. "studies named 'ABC'" and "studies named 'abc'".
+    """
+    return ' '.join(prompt.split())
@@ -4,8 +4,15 @@ from dotenv import load_dotenv
 import pandas as pd
 from gather_names import ColumnNames
 import datetime
+import decimal
+import sqlite3
 import tqdm
 
+# Relations copied to the SQLite mirror that the SQL agent explores, parents before the relations referencing them
+MIRRORED_RELATIONS = ['studies','direction_types','movement_types','vehicle_types','studies_directions',
+                      'directions_movements','movement_vehicle_classes']
+MIRROR_BATCH_SIZE = 10000
+
 def create_dummy_table(connection_string:str)->None:
     """
     Create a dummy table called books in the database, and prints the results. 
@@ -518,6 +525,168 @@ def populate_volume_data(connection_string:str)->None:
         input_volume(cursor=cursor,file_path=file_path)
         connection.commit()    
 
+def create_indexes(connection_string:str)->None:
+    """
+    Create the indexes used by the map's study filters. Run after the data is populated, since building an index
+    once is faster than maintaining it during the bulk inserts.
+    
+    ### Parameters:
+    1. connection_string: ``str``
+        - String used to connect to the database
+    
+    ### Returns:
+    Nothing
+    
+    ### Effects:
+    Creates indexes on the studies, studies_directions and direction_types relations.
+    """
+    connection = psycopg2.connect(connection_string)
+    cursor = connection.cursor()
+    
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS studies_study_date_idx
+                   ON studies (study_date);
+                   """)
+    
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS studies_directions_miovision_direction_idx
+                   ON studies_directions (miovision_id, direction_type_id);
+                   """)
+    
+    cursor.execute("""
+                   CREATE INDEX IF NOT EXISTS direction_types_lower_name_idx
+                   ON direction_types (lower(direction_name));
+                   """)
+    connection.commit()
+
+def bump_data_version(connection_string:str)->None:
+    """
+    Increment the data version, signalling to the servers that cached query results are stale.
+    
+    ### Parameters:
+    1. connection_string: ``str``
+        - String used to connect to the database
+    
+    ### Returns:
+    Nothing
+    
+    ### Effects:
+    Creates the data_version relation if needed, and increments its version. The relation is never dropped by
+    ``configure_schema``, so the version keeps increasing across full re-ingestions.
+    """
+    connection = psycopg2.connect(connection_string)
+    cursor = connection.cursor()
+    
+    cursor.execute("""
+                   CREATE TABLE IF NOT EXISTS data_version(
+                       id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                       version INTEGER NOT NULL,
+                       updated_at TIMESTAMP NOT NULL DEFAULT now()
+                   );
+                   """)
+    
+    cursor.execute("""
+                   INSERT INTO data_version (version)
+                   VALUES (1)
+                   ON CONFLICT (id) DO UPDATE
+                   SET version = data_version.version + 1,
+                       updated_at = now();
+                   """)
+    connection.commit()
+
+def export_sqlite_mirror(connection_string:str,mirror_path:str)->None:
+    """
+    Copy the traffic relations into a SQLite file, used by the SQL agent to explore the schema and check its queries
+    without loading the hosted database.
+    
+    The column types, primary and foreign keys are copied as Postgres declares them, which SQLite accepts, so the
+    schema the agent reads matches the one its final query runs against. Every foreign key column is indexed, since
+    the agent's queries mostly join along them.
+    
+    ### Parameters:
+    1. connection_string: ``str``
+        - String used to connect to the database
+    2. mirror_path: ``str``
+        - Path of the SQLite file
+    
+    ### Returns:
+    Nothing
+    
+    ### Effects:
+    Replaces the file at mirror_path. The mirror is built beside it and swapped in once complete, so an agent never
+    sees a partial copy.
+    """
+    temporary_path = f"{mirror_path}.tmp"
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+    
+    connection = psycopg2.connect(connection_string)
+    cursor = connection.cursor()
+    mirror = sqlite3.connect(temporary_path)
+    
+    print("Exporting SQLite mirror: ")
+    for relation in tqdm.tqdm(MIRRORED_RELATIONS):
+        cursor.execute("""
+                       SELECT column_name, data_type, character_maximum_length
+                       FROM information_schema.columns
+                       WHERE table_schema = current_schema() AND table_name = %s
+                       ORDER BY ordinal_position;
+                       """,(relation,))
+        columns = cursor.fetchall()
+        
+        cursor.execute("""
+                       SELECT pg_get_constraintdef(oid)
+                       FROM pg_constraint
+                       WHERE conrelid = %s::regclass AND contype IN ('p','f')
+                       ORDER BY contype DESC;
+                       """,(relation,))
+        constraints = [row[0] for row in cursor.fetchall()]
+        
+        cursor.execute("""
+                       SELECT attribute.attname
+                       FROM pg_constraint AS foreign_key
+                       JOIN pg_attribute AS attribute
+                       ON attribute.attrelid = foreign_key.conrelid AND attribute.attnum = ANY(foreign_key.conkey)
+                       WHERE foreign_key.conrelid = %s::regclass AND foreign_key.contype = 'f';
+                       """,(relation,))
+        foreign_key_columns = [row[0] for row in cursor.fetchall()]
+        
+        definitions = []
+        for column_name, data_type, maximum_length in columns:
+            column_type = data_type.upper() if maximum_length is None else f"{data_type.upper()}({maximum_length})"
+            definitions.append(f"{column_name} {column_type}")
+        mirror.execute(f"CREATE TABLE {relation} ({', '.join(definitions + constraints)});")
+        
+        column_names = [column[0] for column in columns]
+        insert = f"INSERT INTO {relation} VALUES ({', '.join('?' for _ in column_names)});"
+        with connection.cursor(name=f"mirror_{relation}") as rows_cursor:
+            rows_cursor.itersize = MIRROR_BATCH_SIZE
+            rows_cursor.execute(f"SELECT {', '.join(column_names)} FROM {relation};")
+            while True:
+                rows = rows_cursor.fetchmany(MIRROR_BATCH_SIZE)
+                if not rows:
+                    break
+                mirror.executemany(insert,[tuple(_mirror_value(value) for value in row) for row in rows])
+        
+        # Built after the rows are inserted, which is faster than maintaining them during the inserts
+        for column_name in foreign_key_columns:
+            mirror.execute(f"CREATE INDEX {relation}_{column_name}_idx ON {relation} ({column_name});")
+        mirror.commit()
+    
+    mirror.execute("ANALYZE;")
+    mirror.commit()
+    mirror.close()
+    connection.close()
+    os.replace(temporary_path,mirror_path)
+
+def _mirror_value(value):
+    # SQLite has no decimal or date types, dates are stored as ISO text which compares and sorts the same way
+    if isinstance(value,decimal.Decimal):
+        return float(value)
+    if isinstance(value,(datetime.date,datetime.datetime)):
+        return value.isoformat()
+    return value
+
 if __name__ == "__main__":
     load_dotenv()
     database_connection_string = os.getenv("DATABASE_URL")
@@ -526,4 +695,10 @@ if __name__ == "__main__":
     input_vehicle_types(database_connection_string)
     input_movement_types(database_connection_string)
     populate_studies_data(database_connection_string)
-    populate_volume_data(connection_string=database_connection_string)
\ No newline at end of file
+    populate_volume_data(connection_string=database_connection_string)
+    create_indexes(database_connection_string)
+    bump_data_version(database_connection_string)
+    
+    mirror_path = os.getenv("SQLITE_MIRROR_PATH")
+    if mirror_path:
+        export_sqlite_mirror(connection_string=database_connection_string,mirror_path=mirror_path)
\ No newline at end of file
@@ -0,0 +1,11 @@
+from .csv_writer import iterate_csv
+from .download_tokens import DownloadTokenSigner, InvalidDownloadTokenError
+from .formats import (COMPRESSIONS, EXPORT_FORMATS, ExportFormatError, iterate_compressed, negotiate_format,
+                      requires_stream_compression, validate_compression, write_export)
+from .jobs import ExportJob, ExportJobQueue
+from .xlsx_writer import XLSX_MEDIA_TYPE, create_temporary_path, iterate_file, write_xlsx
+
+__all__ = ['COMPRESSIONS', 'EXPORT_FORMATS', 'DownloadTokenSigner', 'ExportFormatError', 'ExportJob', 'ExportJobQueue',
+           'InvalidDownloadTokenError', 'XLSX_MEDIA_TYPE', 'create_temporary_path', 'iterate_compressed', 'iterate_csv',
+           'iterate_file', 'negotiate_format', 'requires_stream_compression', 'validate_compression', 'write_export',
+           'write_xlsx']
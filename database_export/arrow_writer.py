@@ -0,0 +1,116 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Iterable, Optional
+
+# pyarrow takes a noticeable share of the server's import time, so it is only imported once an export needs it
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+PARQUET_MEDIA_TYPE = 'application/vnd.apache.parquet'
+ARROW_MEDIA_TYPE = 'application/vnd.apache.arrow.file'
+
+def write_parquet(columns:list[str],row_batches:Iterable[list[tuple]],path:str,compression:Optional[str]=None)->None:
+    """
+    Write the row batches into a Parquet file, one row group per batch.
+
+    ### Parameters
+    1. columns : ``list[str]``
+        - Column names of the rows.
+    2. row_batches : ``Iterable[list[tuple]]``
+        - Rows to be written, typically produced by ``SQLAgent.return_row_batches``.
+    3. path : ``str``
+        - Path of the file to be created.
+    4. compression : ``str | None``
+        - Parquet codec (``gzip`` or ``zstd``). Snappy is used when omitted.
+
+    ### Effects
+    Creates the file at the given path.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet
+    writer = None
+    schema = None
+
+    try:
+        for batch in row_batches:
+            if not batch:
+                continue
+            if schema is None:
+                schema = _infer_schema(columns=columns,batch=batch)
+                writer = pa.parquet.ParquetWriter(path,schema,compression=compression or 'snappy')
+            writer.write_batch(_to_record_batch(batch=batch,schema=schema))
+
+        if writer is None:
+            pa.parquet.write_table(_empty_schema(columns).empty_table(),path)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def write_arrow(columns:list[str],row_batches:Iterable[list[tuple]],path:str,compression:Optional[str]=None)->None:
+    """
+    Write the row batches into an Arrow IPC file (Feather V2), one record batch per row batch.
+
+    ### Parameters
+    1. columns : ``list[str]``
+        - Column names of the rows.
+    2. row_batches : ``Iterable[list[tuple]]``
+        - Rows to be written, typically produced by ``SQLAgent.return_row_batches``.
+    3. path : ``str``
+        - Path of the file to be created.
+    4. compression : ``str | None``
+        - IPC buffer codec, only ``zstd`` is supported. Buffers are left uncompressed when omitted.
+
+    ### Effects
+    Creates the file at the given path.
+    """
+    import pyarrow as pa
+    import pyarrow.ipc
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    writer = None
+    schema = None
+
+    with pa.OSFile(path,'wb') as sink:
+        try:
+            for batch in row_batches:
+                if not batch:
+                    continue
+                if schema is None:
+                    schema = _infer_schema(columns=columns,batch=batch)
+                    writer = pa.ipc.new_file(sink,schema,options=options)
+                writer.write_batch(_to_record_batch(batch=batch,schema=schema))
+
+            if writer is None:
+                writer = pa.ipc.new_file(sink,_empty_schema(columns),options=options)
+        finally:
+            if writer is not None:
+                writer.close()
+
+def _empty_schema(columns:list[str])->pa.Schema:
+    import pyarrow as pa
+    return pa.schema([pa.field(name,pa.string()) for name in columns])
+
+def _infer_schema(columns:list[str],batch:list[tuple])->pa.Schema:
+    """
+    Infer the schema from the first batch. Decimals are widened to float64 since the scale of a NUMERIC column can
+    differ from batch to batch, and columns that are entirely null fall back to strings.
+    """
+    import pyarrow as pa
+    fields = []
+    for name, values in zip(columns,zip(*batch)):
+        data_type = pa.array(values).type
+        if pa.types.is_decimal(data_type):
+            data_type = pa.float64()
+        elif pa.types.is_null(data_type):
+            data_type = pa.string()
+        fields.append(pa.field(name,data_type))
+    return pa.schema(fields)
+
+def _to_record_batch(batch:list[tuple],schema:pa.Schema)->pa.RecordBatch:
+    import pyarrow as pa
+    arrays = []
+    for field, values in zip(schema,zip(*batch)):
+        if pa.types.is_string(field.type):
+            values = [value if value is None else str(value) for value in values]
+        elif pa.types.is_floating(field.type):
+            values = [value if value is None else float(value) for value in values]
+        arrays.append(pa.array(values,type=field.type))
+    return pa.RecordBatch.from_arrays(arrays,schema=schema)
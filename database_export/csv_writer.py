@@ -0,0 +1,50 @@
+import csv
+import io
+from typing import Iterable, Iterator
+
+CSV_MEDIA_TYPE = 'text/csv'
+
+def iterate_csv(columns:list[str],row_batches:Iterable[list[tuple]])->Iterator[bytes]:
+    """
+    Lazily encode the row batches as UTF-8 CSV, producing one chunk per batch. Nothing is buffered beyond the current
+    batch, so the output can be sent to the client while the database is still producing rows.
+
+    ### Parameters
+    1. columns : ``list[str]``
+        - Column names written as the header.
+    2. row_batches : ``Iterable[list[tuple]]``
+        - Rows to be written, typically produced by ``SQLAgent.return_row_batches``.
+
+    ### Returns
+    An iterator of ``bytes`` chunks.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    yield buffer.getvalue().encode('utf-8')
+
+    for batch in row_batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+
+def write_csv(columns:list[str],row_batches:Iterable[list[tuple]],path:str)->None:
+    """
+    Write the row batches into a CSV file.
+
+    ### Parameters
+    1. columns : ``list[str]``
+        - Column names written as the header.
+    2. row_batches : ``Iterable[list[tuple]]``
+        - Rows to be written.
+    3. path : ``str``
+        - Path of the file to be created.
+
+    ### Effects
+    Creates the file at the given path.
+    """
+    with open(path,'wb') as file:
+        for chunk in iterate_csv(columns=columns,row_batches=row_batches):
+            file.write(chunk)
@@ -0,0 +1,89 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from typing import Any, Optional
+
+DEFAULT_TOKEN_TTL = 3600.0
+
+class InvalidDownloadTokenError(ValueError):
+    """
+    Raised when a download token is malformed, was not signed by this server or has expired.
+    """
+
+class DownloadTokenSigner:
+    """
+    Issues signed, self-contained tokens naming a query to export later. Nothing is stored on the server, so a token
+    can be redeemed by any instance sharing the secret, and a preview that is never downloaded costs nothing.
+    """
+    def __init__(self,secret:Optional[bytes]=None,ttl_seconds:float=DEFAULT_TOKEN_TTL):
+        # Without a configured secret, tokens are only valid for the lifetime of this process
+        self.__secret = secret or secrets.token_bytes(32)
+        self.ttl_seconds = ttl_seconds
+
+    @classmethod
+    def from_environment(cls)->'DownloadTokenSigner':
+        """
+        Create the signer from the ``DOWNLOAD_TOKEN_SECRET`` and ``DOWNLOAD_TOKEN_TTL`` environment variables,
+        falling back to a random secret and the default TTL for any that are not set.
+
+        ### Raises
+        ``RuntimeError`` if no secret is set while ``WEB_CONCURRENCY`` configures more than one worker process, as each
+        worker would reject the tokens signed by the others.
+        """
+        secret = os.getenv("DOWNLOAD_TOKEN_SECRET")
+        workers = int(os.getenv("WEB_CONCURRENCY") or 1)
+        if not secret and workers > 1:
+            raise RuntimeError(
+                f"DOWNLOAD_TOKEN_SECRET must be set when running {workers} workers, "
+                "otherwise download links only work on the worker that issued them"
+            )
+        return cls(
+            secret=secret.encode('utf-8') if secret else None,
+            ttl_seconds=float(os.getenv("DOWNLOAD_TOKEN_TTL",DEFAULT_TOKEN_TTL))
+        )
+
+    def issue(self,query:str)->str:
+        """
+        Create a token that can be exchanged for the export of the query until the TTL runs out.
+        """
+        payload = json.dumps({'q': query, 'e': time.time() + self.ttl_seconds},separators=(',',':')).encode('utf-8')
+        return f"{_encode(payload)}.{_encode(self.__sign(payload))}"
+
+    def redeem(self,token:str)->str:
+        """
+        Return the query stored in the token.
+
+        ### Raises
+        ``InvalidDownloadTokenError`` if the token is malformed, its signature does not match or it has expired.
+        """
+        try:
+            encoded_payload, encoded_signature = token.split('.')
+            payload = _decode(encoded_payload)
+            signature = _decode(encoded_signature)
+        except ValueError as exc:
+            raise InvalidDownloadTokenError("Malformed download token") from exc
+
+        if not hmac.compare_digest(signature,self.__sign(payload)):
+            raise InvalidDownloadTokenError("Download token was not issued by this server")
+
+        try:
+            content: dict[str,Any] = json.loads(payload)
+            query, expires_at = content['q'], float(content['e'])
+        except (ValueError, KeyError, TypeError) as exc:
+            raise InvalidDownloadTokenError("Malformed download token") from exc
+        if expires_at < time.time():
+            raise InvalidDownloadTokenError("Download token has expired")
+        return query
+
+    def __sign(self,payload:bytes)->bytes:
+        return hmac.new(self.__secret,payload,hashlib.sha256).digest()
+
+def _encode(data:bytes)->str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def _decode(text:str)->bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
@@ -0,0 +1,169 @@
+import zlib
+from typing import Iterable, Iterator, NamedTuple, Optional
+from .arrow_writer import ARROW_MEDIA_TYPE, PARQUET_MEDIA_TYPE, write_arrow, write_parquet
+from .csv_writer import CSV_MEDIA_TYPE, write_csv
+from .xlsx_writer import XLSX_MEDIA_TYPE, write_xlsx
+
+DEFAULT_EXPORT_FORMAT = 'xlsx'
+
+class ExportFormat(NamedTuple):
+    media_type: str
+    extension: str
+    # Codecs the file format applies internally, any other compression is applied over the whole file
+    native_compressions: frozenset
+
+class Compression(NamedTuple):
+    media_type: str
+    extension: str
+
+EXPORT_FORMATS = {
+    'xlsx': ExportFormat(media_type=XLSX_MEDIA_TYPE,extension='xlsx',native_compressions=frozenset()),
+    'csv': ExportFormat(media_type=CSV_MEDIA_TYPE,extension='csv',native_compressions=frozenset()),
+    'parquet': ExportFormat(media_type=PARQUET_MEDIA_TYPE,extension='parquet',native_compressions=frozenset({'gzip','zstd'})),
+    'arrow': ExportFormat(media_type=ARROW_MEDIA_TYPE,extension='arrow',native_compressions=frozenset({'zstd'}))
+}
+
+COMPRESSIONS = {
+    'gzip': Compression(media_type='application/gzip',extension='gz'),
+    'zstd': Compression(media_type='application/zstd',extension='zst')
+}
+
+class ExportFormatError(ValueError):
+    """
+    Raised when the requested export format or compression is not supported.
+    """
+
+def negotiate_format(requested_format:Optional[str],accept:Optional[str])->str:
+    """
+    Decide the export format. An explicitly requested format takes precedence over the ``Accept`` header, and
+    the default format is used when neither names a supported format.
+
+    ### Parameters
+    1. requested_format : ``str | None``
+        - Value of the ``format`` query parameter.
+    2. accept : ``str | None``
+        - Value of the ``Accept`` request header.
+
+    ### Returns
+    The key of the format in ``EXPORT_FORMATS`` as a ``str``
+
+    ### Raises
+    ``ExportFormatError`` if the requested format is not supported.
+    """
+    if requested_format:
+        requested_format = requested_format.lower()
+        if requested_format not in EXPORT_FORMATS:
+            raise ExportFormatError(f"Unsupported export format '{requested_format}', expected one of {list(EXPORT_FORMATS)}")
+        return requested_format
+
+    if not accept:
+        return DEFAULT_EXPORT_FORMAT
+
+    media_type_formats = {export_format.media_type: name for name, export_format in EXPORT_FORMATS.items()}
+    candidates = []
+
+    for position, media_range in enumerate(accept.split(',')):
+        media_type, *parameters = [part.strip() for part in media_range.split(';')]
+        quality = 1.0
+        for parameter in parameters:
+            key, _, value = parameter.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if quality > 0 and media_type.lower() in media_type_formats:
+            # Prefer the highest quality, then the order in which the client listed the types
+            candidates.append((-quality,position,media_type_formats[media_type.lower()]))
+
+    if candidates:
+        return min(candidates)[2]
+    return DEFAULT_EXPORT_FORMAT
+
+def validate_compression(compression:Optional[str])->Optional[str]:
+    """
+    Normalize the requested compression.
+
+    ### Parameters
+    1. compression : ``str | None``
+        - Value of the ``compression`` query parameter, ``none`` is treated as no compression.
+
+    ### Returns
+    The key of the compression in ``COMPRESSIONS``, or ``None``
+
+    ### Raises
+    ``ExportFormatError`` if the compression is not supported.
+    """
+    if not compression or compression.lower() == 'none':
+        return None
+
+    compression = compression.lower()
+    if compression not in COMPRESSIONS:
+        raise ExportFormatError(f"Unsupported compression '{compression}', expected one of {list(COMPRESSIONS)}")
+    return compression
+
+def write_export(export_format:str,columns:list[str],row_batches:Iterable[list[tuple]],path:str,compression:Optional[str]=None)->None:
+    """
+    Write the row batches into a file of the given export format. Only compression that is native to the format
+    is applied here, see ``iterate_compressed`` for the rest.
+
+    ### Parameters
+    1. export_format : ``str``
+        - Key of the format in ``EXPORT_FORMATS``.
+    2. columns : ``list[str]``
+        - Column names of the rows.
+    3. row_batches : ``Iterable[list[tuple]]``
+        - Rows to be written.
+    4. path : ``str``
+        - Path of the file to be created.
+    5. compression : ``str | None``
+        - Key of the compression in ``COMPRESSIONS``.
+
+    ### Effects
+    Creates the file at the given path.
+    """
+    native_compression = compression if compression in EXPORT_FORMATS[export_format].native_compressions else None
+
+    if export_format == 'xlsx':
+        write_xlsx(columns=columns,row_batches=row_batches,path=path)
+    elif export_format == 'csv':
+        write_csv(columns=columns,row_batches=row_batches,path=path)
+    elif export_format == 'parquet':
+        write_parquet(columns=columns,row_batches=row_batches,path=path,compression=native_compression)
+    elif export_format == 'arrow':
+        write_arrow(columns=columns,row_batches=row_batches,path=path,compression=native_compression)
+    else:
+        raise ExportFormatError(f"Unsupported export format '{export_format}'")
+
+def requires_stream_compression(export_format:str,compression:Optional[str])->bool:
+    """
+    Check whether the compression has to be applied over the whole file rather than inside the format.
+    """
+    return compression is not None and compression not in EXPORT_FORMATS[export_format].native_compressions
+
+def iterate_compressed(chunks:Iterable[bytes],compression:str)->Iterator[bytes]:
+    """
+    Lazily compress a stream of chunks.
+
+    ### Parameters
+    1. chunks : ``Iterable[bytes]``
+        - Uncompressed chunks.
+    2. compression : ``str``
+        - Key of the compression in ``COMPRESSIONS``.
+
+    ### Returns
+    An iterator of compressed ``bytes`` chunks.
+    """
+    if compression == 'gzip':
+        # A window size of 16 + MAX_WBITS makes zlib produce a gzip container
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    else:
+        import zstandard
+        compressor = zstandard.ZstdCompressor().compressobj()
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,214 @@
+import os
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+from .formats import COMPRESSIONS, EXPORT_FORMATS, iterate_compressed, requires_stream_compression, write_export
+from .xlsx_writer import iterate_file
+
+DEFAULT_WORKERS = 2
+DEFAULT_RESULT_TTL = 3600.0
+DEFAULT_RESULT_MAX_BYTES = 1_000_000_000
+DEFAULT_RESULT_DIRECTORY = os.path.join(tempfile.gettempdir(),'coe_exports')
+
+_PROCESS_DIRECTORY_PATTERN = re.compile(r'process-([0-9]+)')
+_HOST_NAME_UNSAFE = re.compile(r'[^A-Za-z0-9._-]')
+
+RowFetcher = Callable[[str],tuple[list[str],Iterator[list[tuple]]]]
+
+class ExportJob:
+    """
+    State of a single export. ``status`` moves from ``queued`` to ``running`` and ends as ``completed`` or ``failed``.
+    """
+    def __init__(self,job_id:str,query:str,export_format:str,compression:Optional[str]):
+        self.job_id = job_id
+        self.query = query
+        self.export_format = export_format
+        self.compression = compression
+        self.status = 'queued'
+        self.error = None
+        self.path = None
+        self.file_name = None
+        self.media_type = None
+        self.size_bytes = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    @property
+    def finished(self)->bool:
+        return self.done.is_set()
+
+class ExportJobQueue:
+    """
+    Runs exports on a bounded pool of worker threads so request threads return immediately. Finished files are kept
+    in the result directory until they are older than the TTL, or until the directory exceeds its size budget, in
+    which case the oldest results are evicted first.
+
+    Job state lives in the memory of the process that accepted the job, so the queue needs a single long-lived
+    process, or workers that route every poll and download of a job back to the process that accepted it. It does
+    not work on serverless targets such as Vercel, where instances are short-lived and requests are spread across
+    them. Each process keeps its files in a subdirectory named after its host and process id, so processes sharing
+    the directory, on this host or on others, never remove each other's results.
+    """
+    def __init__(self,fetch_rows:RowFetcher,result_directory:str=DEFAULT_RESULT_DIRECTORY,max_workers:int=DEFAULT_WORKERS,
+                 ttl_seconds:float=DEFAULT_RESULT_TTL,max_total_bytes:int=DEFAULT_RESULT_MAX_BYTES):
+        self.fetch_rows = fetch_rows
+        # Process ids are only meaningful on their own host, so each host reaps nothing but its own directories
+        host_directory = os.path.join(result_directory,f"host-{_HOST_NAME_UNSAFE.sub('_',socket.gethostname())}")
+        self.result_directory = os.path.join(host_directory,f"process-{os.getpid()}")
+        self.ttl_seconds = ttl_seconds
+        self.max_total_bytes = max_total_bytes
+
+        self.__jobs: dict[str,ExportJob] = {}
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers,thread_name_prefix='export-job')
+
+        # Jobs only live in memory, so results left by processes that have exited can never be downloaded again.
+        # A directory with this process's id can only have been left by an earlier process that reused the id
+        os.makedirs(host_directory,exist_ok=True)
+        for directory_name in os.listdir(host_directory):
+            match = _PROCESS_DIRECTORY_PATTERN.fullmatch(directory_name)
+            if match and (int(match.group(1)) == os.getpid() or not _process_alive(int(match.group(1)))):
+                shutil.rmtree(os.path.join(host_directory,directory_name),ignore_errors=True)
+        os.makedirs(self.result_directory,exist_ok=True)
+
+    @classmethod
+    def from_environment(cls,fetch_rows:RowFetcher)->'ExportJobQueue':
+        """
+        Create the queue from the ``EXPORT_RESULT_DIRECTORY``, ``EXPORT_WORKERS``, ``EXPORT_RESULT_TTL`` and
+        ``EXPORT_RESULT_MAX_BYTES`` environment variables, falling back to the defaults for any that are not set.
+        """
+        return cls(
+            fetch_rows=fetch_rows,
+            result_directory=os.getenv("EXPORT_RESULT_DIRECTORY",DEFAULT_RESULT_DIRECTORY),
+            max_workers=int(os.getenv("EXPORT_WORKERS",DEFAULT_WORKERS)),
+            ttl_seconds=float(os.getenv("EXPORT_RESULT_TTL",DEFAULT_RESULT_TTL)),
+            max_total_bytes=int(os.getenv("EXPORT_RESULT_MAX_BYTES",DEFAULT_RESULT_MAX_BYTES))
+        )
+
+    def submit(self,query:str,export_format:str,compression:Optional[str]=None)->ExportJob:
+        """
+        Queue an export of the query.
+
+        ### Parameters
+        1. query : ``str``
+            - Query to be exported.
+        2. export_format : ``str``
+            - Key of the format in ``EXPORT_FORMATS``.
+        3. compression : ``str | None``
+            - Key of the compression in ``COMPRESSIONS``.
+
+        ### Returns
+        The queued ``ExportJob``
+        """
+        self.evict()
+
+        job = ExportJob(job_id=uuid.uuid4().hex,query=query,export_format=export_format,compression=compression)
+        with self.__lock:
+            self.__jobs[job.job_id] = job
+        self.__executor.submit(self.__run,job)
+        return job
+
+    def get(self,job_id:str)->Optional[ExportJob]:
+        """
+        Return the job with the given id, or ``None`` if it does not exist or has been evicted.
+        """
+        with self.__lock:
+            return self.__jobs.get(job_id)
+
+    def wait(self,job_id:str,timeout:float)->Optional[ExportJob]:
+        """
+        Block until the job finishes or the timeout elapses, then return it. Used to long-poll for completion.
+        """
+        job = self.get(job_id)
+        if job is not None:
+            job.done.wait(timeout=timeout)
+        return job
+
+    def evict(self)->None:
+        """
+        Remove finished jobs older than the TTL, and the oldest results until the size budget is met.
+
+        ### Effects
+        Deletes the files of the evicted jobs.
+        """
+        now = time.time()
+        with self.__lock:
+            finished = sorted(
+                (job for job in self.__jobs.values() if job.finished),
+                key=lambda job: job.finished_at
+            )
+            total_bytes = sum(job.size_bytes or 0 for job in finished)
+            evicted = []
+
+            for index, job in enumerate(finished):
+                expired = now - job.finished_at > self.ttl_seconds
+                # The most recent result is always kept, even if it exceeds the budget on its own
+                over_budget = total_bytes > self.max_total_bytes and index < len(finished) - 1
+                if expired or over_budget:
+                    total_bytes -= job.size_bytes or 0
+                    evicted.append(self.__jobs.pop(job.job_id))
+
+        for job in evicted:
+            if job.path is not None and os.path.exists(job.path):
+                os.remove(job.path)
+
+    def shutdown(self)->None:
+        self.__executor.shutdown(wait=False,cancel_futures=True)
+
+    def __run(self,job:ExportJob)->None:
+        job.status = 'running'
+        job.started_at = time.time()
+        file_format = EXPORT_FORMATS[job.export_format]
+        path = os.path.join(self.result_directory,f"{job.job_id}.{file_format.extension}")
+        compressed_path = None
+
+        try:
+            columns, row_batches = self.fetch_rows(job.query)
+            write_export(export_format=job.export_format,columns=columns,row_batches=row_batches,path=path,compression=job.compression)
+            job.file_name = f"Book.{file_format.extension}"
+            job.media_type = file_format.media_type
+
+            if requires_stream_compression(export_format=job.export_format,compression=job.compression):
+                compression = COMPRESSIONS[job.compression]
+                compressed_path = f"{path}.{compression.extension}"
+                with open(compressed_path,'wb') as file:
+                    for chunk in iterate_compressed(chunks=iterate_file(path),compression=job.compression):
+                        file.write(chunk)
+                os.remove(path)
+                path = compressed_path
+                job.file_name = f"{job.file_name}.{compression.extension}"
+                job.media_type = compression.media_type
+
+            job.path = path
+            job.size_bytes = os.path.getsize(path)
+            job.status = 'completed'
+        except Exception as e:
+            for created_path in (path,compressed_path):
+                if created_path is not None and os.path.exists(created_path):
+                    os.remove(created_path)
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+            job.done.set()
+
+        # Completed results count against the size budget straight away
+        self.evict()
+
+def _process_alive(pid:int)->bool:
+    try:
+        os.kill(pid,0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists but belongs to another user
+        return True
+    return True
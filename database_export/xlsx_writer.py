@@ -0,0 +1,107 @@
+import datetime
+import os
+import tempfile
+from decimal import Decimal
+from typing import Iterable, Iterator
+
+# Excel worksheets are limited to 1,048,576 rows, one of which is used by the header
+EXCEL_MAX_ROWS = 1_048_576
+FILE_CHUNK_SIZE = 64 * 1024
+
+XLSX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Types that xlsxwriter is able to write natively, everything else is written as a string
+_NATIVE_CELL_TYPES = (str, int, float, bool, Decimal, datetime.date, datetime.datetime, datetime.time, datetime.timedelta)
+
+def create_temporary_path(suffix:str)->str:
+    """
+    Create an empty temporary file and return its path. The caller is responsible for removing the file.
+
+    ### Parameters
+    1. suffix : ``str``
+        - File extension given to the temporary file.
+
+    ### Returns
+    The path of the file as a ``str``
+    """
+    file_descriptor, path = tempfile.mkstemp(suffix=suffix)
+    os.close(file_descriptor)
+    return path
+
+def iterate_file(path:str,chunk_size:int=FILE_CHUNK_SIZE)->Iterator[bytes]:
+    """
+    Lazily read the file in fixed size chunks, used as the body of streaming responses.
+
+    ### Parameters
+    1. path : ``str``
+        - Path of the file to be read.
+    2. chunk_size : ``int``
+        - Maximum number of bytes produced per chunk.
+
+    ### Returns
+    An iterator of ``bytes`` chunks.
+    """
+    with open(path,'rb') as file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+def write_xlsx(columns:list[str],row_batches:Iterable[list[tuple]],path:str)->int:
+    """
+    Write the row batches into an Excel workbook using xlsxwriter's constant memory mode, so that only the current
+    row is kept in memory. Whenever a worksheet reaches the Excel row limit, the remaining rows continue on a new
+    worksheet with its own header.
+
+    ### Parameters
+    1. columns : ``list[str]``
+        - Column names written as the header of every worksheet.
+    2. row_batches : ``Iterable[list[tuple]]``
+        - Rows to be written, typically produced by ``SQLAgent.return_row_batches``.
+    3. path : ``str``
+        - Path of the workbook to be created.
+
+    ### Returns
+    The number of data rows written as an ``int``
+
+    ### Effects
+    Creates the workbook at the given path.
+    """
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(path,{
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd',
+        'remove_timezone': True,
+        'nan_inf_to_errors': True,
+        'strings_to_urls': False
+    })
+    header_format = workbook.add_format({'bold': True})
+
+    rows_per_sheet = EXCEL_MAX_ROWS - 1
+    total_rows = 0
+    worksheet = None
+    sheet_row = rows_per_sheet
+
+    try:
+        for batch in row_batches:
+            for row in batch:
+                if sheet_row == rows_per_sheet:
+                    worksheet = workbook.add_worksheet(f"Sheet{len(workbook.worksheets()) + 1}")
+                    worksheet.write_row(0,0,columns,header_format)
+                    sheet_row = 0
+
+                sheet_row += 1
+                worksheet.write_row(sheet_row,0,[_to_cell_value(value) for value in row])
+            total_rows += len(batch)
+
+        # An empty result still produces a workbook containing the header
+        if worksheet is None:
+            worksheet = workbook.add_worksheet("Sheet1")
+            worksheet.write_row(0,0,columns,header_format)
+    finally:
+        workbook.close()
+
+    return total_rows
+
+def _to_cell_value(value):
+    if value is None or isinstance(value,_NATIVE_CELL_TYPES):
+        return value
+    return str(value)
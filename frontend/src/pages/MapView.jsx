@@ -1,5 +1,5 @@
-import { useEffect, useMemo, useState } from "react";
-import { MapContainer, TileLayer, CircleMarker, Tooltip, Popup } from "react-leaflet";
+import { useCallback, useEffect, useMemo, useRef, useState } from "react";
+import { MapContainer, TileLayer, CircleMarker, Tooltip, Popup, useMapEvents } from "react-leaflet";
 
 const MAP_CENTER = [53.5461, -113.4938];
 const MAP_LAYERS = {
@@ -21,10 +21,15 @@ const DIRECTION_OPTIONS = ["All", "Northbound", "Southbound", "Eastbound", "West
 const DEFAULT_START_YEAR = 2020;
 const DEFAULT_END_YEAR = 2024;
 const API_BASE = "http://127.0.0.1:8000";
-const GEOJSON_ENDPOINTS = {
-  miovision: `${API_BASE}/geojson/mv_points_snapped`,
-  estimation: `${API_BASE}/geojson/estimation_points_snapped`
+const CLUSTER_ENDPOINT = `${API_BASE}/clusters`;
+const TILE_ENDPOINT = `${API_BASE}/tiles`;
+const POINT_LAYERS = {
+  miovision: "mv_points_snapped",
+  estimation: "estimation_points_snapped"
 };
+// Highest zoom the server clusters at. Zoomed in further every point is shown on its own, and the points are
+// fetched as tiles, which stay cached across pans instead of being refetched for every viewport.
+const MAX_CLUSTER_ZOOM = 16;
 
 const CSV_HEADERS = ["id", "year", "direction", "lat", "lon"];
 
@@ -43,6 +48,81 @@ const getLatLon = (feature) => {
   };
 };
 
+const toBboxParam = (bounds) =>
+  [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()]
+    .map((value) => value.toFixed(6))
+    .join(",");
+
+// Requests the studies matching the filters, limited to the bounds when given.
+const requestStudies = async (filters, bounds, signal) => {
+  const params = new URLSearchParams({
+    start_year: filters.startYear.toString(),
+    end_year: filters.endYear.toString()
+  });
+
+  if (filters.direction && filters.direction !== "All") {
+    params.append("direction", filters.direction);
+  }
+
+  if (bounds) {
+    params.append("bbox", toBboxParam(bounds));
+  }
+
+  const response = await fetch(`${API_BASE}/query/studies?${params.toString()}`, { signal });
+
+  if (!response.ok) {
+    throw new Error(`Request failed with status ${response.status}`);
+  }
+
+  const data = await response.json();
+  return Array.isArray(data?.features) ? data.features : [];
+};
+
+const lonToTileX = (lon, zoom) => Math.floor(((lon + 180) / 360) * 2 ** zoom);
+
+const latToTileY = (lat, zoom) => {
+  const clamped = Math.max(Math.min(lat, 85.0511287798), -85.0511287798);
+  const radians = (clamped * Math.PI) / 180;
+  return Math.floor(((1 - Math.asinh(Math.tan(radians)) / Math.PI) / 2) * 2 ** zoom);
+};
+
+// Lists the "z/x/y" keys of the map tiles covering the bounds.
+const visibleTiles = (bounds, zoom) => {
+  const last = 2 ** zoom - 1;
+  const clamp = (value) => Math.max(Math.min(value, last), 0);
+  const minX = clamp(lonToTileX(bounds.getWest(), zoom));
+  const maxX = clamp(lonToTileX(bounds.getEast(), zoom));
+  const minY = clamp(latToTileY(bounds.getNorth(), zoom));
+  const maxY = clamp(latToTileY(bounds.getSouth(), zoom));
+
+  const tiles = [];
+  for (let x = minX; x <= maxX; x += 1) {
+    for (let y = minY; y <= maxY; y += 1) {
+      tiles.push(`${zoom}/${x}/${y}`);
+    }
+  }
+  return tiles;
+};
+
+// Clusters are drawn larger the more points they hold.
+const clusterRadius = (feature) => Math.min(8 + Math.log2(feature.properties.point_count) * 3, 28);
+
+// Reports the visible map bounds and zoom whenever the user pans or zooms.
+function ViewportTracker({ onChange }) {
+  const onChangeRef = useRef(onChange);
+  onChangeRef.current = onChange;
+
+  const map = useMapEvents({
+    moveend: () => onChangeRef.current(map.getBounds(), map.getZoom())
+  });
+
+  useEffect(() => {
+    onChangeRef.current(map.getBounds(), map.getZoom());
+  }, [map]);
+
+  return null;
+}
+
 const formatCoordinate = (value) => {
   if (typeof value !== "number") {
     return "N/A";
@@ -60,6 +140,9 @@ export default function MapView() {
   const [error, setError] = useState(null);
   const [hasFiltered, setHasFiltered] = useState(false);
   const [selectedStudy, setSelectedStudy] = useState(null);
+  const [viewport, setViewport] = useState(null);
+  const [mapZoom, setMapZoom] = useState(12);
+  const [appliedFilters, setAppliedFilters] = useState(null);
 
   const [miovisionEnabled, setMiovisionEnabled] = useState(true);
   const [estimationEnabled, setEstimationEnabled] = useState(true);
@@ -67,86 +150,136 @@ export default function MapView() {
   const [estimationFeatures, setEstimationFeatures] = useState([]);
   const [layerErrors, setLayerErrors] = useState({ miovision: null, estimation: null });
 
-  useEffect(() => {
-    const fetchMiovision = async () => {
-      try {
-        const response = await fetch(GEOJSON_ENDPOINTS.miovision);
-        if (!response.ok) {
-          throw new Error(`Failed with status ${response.status}`);
-        }
-        const data = await response.json();
-        const features = Array.isArray(data?.features) ? data.features : [];
-        setMiovisionFeatures(features);
-        setLayerErrors((prev) => ({ ...prev, miovision: null }));
-      } catch (fetchError) {
-        setLayerErrors((prev) => ({
-          ...prev,
-          miovision: "Unable to load Miovision points."
-        }));
-      }
-    };
+  // Tile requests are shared across renders; a failed tile is dropped so it is retried on the next move.
+  const tileRequestsRef = useRef(new Map());
+
+  const fetchTile = useCallback((layer, tile) => {
+    const url = `${TILE_ENDPOINT}/${layer}/${tile}`;
+    if (!tileRequestsRef.current.has(url)) {
+      const request = fetch(url)
+        .then((response) => {
+          if (!response.ok) {
+            throw new Error(`Failed with status ${response.status}`);
+          }
+          return response.json();
+        })
+        .then((data) => (Array.isArray(data?.features) ? data.features : []))
+        .catch((fetchError) => {
+          tileRequestsRef.current.delete(url);
+          throw fetchError;
+        });
+      tileRequestsRef.current.set(url, request);
+    }
+    return tileRequestsRef.current.get(url);
+  }, []);
 
-    if (miovisionEnabled && miovisionFeatures.length === 0) {
-      fetchMiovision();
+  const fetchClusters = useCallback(async (layer, params) => {
+    const response = await fetch(`${CLUSTER_ENDPOINT}/${layer}?${params.toString()}`);
+    if (!response.ok) {
+      throw new Error(`Failed with status ${response.status}`);
     }
-  }, [miovisionEnabled, miovisionFeatures.length]);
+    const data = await response.json();
+    return Array.isArray(data?.features) ? data.features : [];
+  }, []);
 
   useEffect(() => {
-    const fetchEstimation = async () => {
+    if (!viewport) {
+      return undefined;
+    }
+
+    let cancelled = false;
+    const zoom = Math.round(mapZoom);
+    const params = new URLSearchParams({
+      zoom: zoom.toString(),
+      bbox: toBboxParam(viewport)
+    });
+    const tiles = zoom > MAX_CLUSTER_ZOOM ? visibleTiles(viewport, Math.floor(mapZoom)) : null;
+    const layers = [
+      {
+        key: "miovision",
+        enabled: miovisionEnabled,
+        setFeatures: setMiovisionFeatures,
+        message: "Unable to load Miovision points."
+      },
+      {
+        key: "estimation",
+        enabled: estimationEnabled,
+        setFeatures: setEstimationFeatures,
+        message: "Unable to load estimation points."
+      }
+    ];
+
+    layers.forEach(async ({ key, enabled, setFeatures, message }) => {
+      if (!enabled) {
+        return;
+      }
       try {
-        const response = await fetch(GEOJSON_ENDPOINTS.estimation);
-        if (!response.ok) {
-          throw new Error(`Failed with status ${response.status}`);
+        // The server clusters the points up to MAX_CLUSTER_ZOOM. Past it, each point belongs to exactly one tile,
+        // so the tiles can be concatenated without duplicates.
+        const features = tiles
+          ? (await Promise.all(tiles.map((tile) => fetchTile(POINT_LAYERS[key], tile)))).flat()
+          : await fetchClusters(POINT_LAYERS[key], params);
+        if (!cancelled) {
+          setFeatures(features);
+          setLayerErrors((prev) => ({ ...prev, [key]: null }));
         }
-        const data = await response.json();
-        const features = Array.isArray(data?.features) ? data.features : [];
-        setEstimationFeatures(features);
-        setLayerErrors((prev) => ({ ...prev, estimation: null }));
       } catch (fetchError) {
-        setLayerErrors((prev) => ({
-          ...prev,
-          estimation: "Unable to load estimation points."
-        }));
+        if (!cancelled) {
+          setLayerErrors((prev) => ({ ...prev, [key]: message }));
+        }
       }
+    });
+
+    return () => {
+      cancelled = true;
     };
+  }, [viewport, mapZoom, miovisionEnabled, estimationEnabled, fetchTile, fetchClusters]);
 
-    if (estimationEnabled && estimationFeatures.length === 0) {
-      fetchEstimation();
-    }
-  }, [estimationEnabled, estimationFeatures.length]);
+  // Only the latest studies request may update the list; older ones are aborted so a slow response cannot
+  // overwrite a newer viewport or refill the list after a reset.
+  const studiesRequestRef = useRef(null);
 
-  const handleFilter = async () => {
+  const fetchStudies = useCallback(async (filters, bounds) => {
+    studiesRequestRef.current?.abort();
+    const controller = new AbortController();
+    studiesRequestRef.current = controller;
     setLoading(true);
     setError(null);
-    setHasFiltered(true);
-    setSelectedStudy(null);
-    setStudies([]);
 
     try {
-      const params = new URLSearchParams({
-        start_year: startYear.toString(),
-        end_year: endYear.toString()
-      });
-
-      if (direction && direction !== "All") {
-        params.append("direction", direction);
-      }
-
-      const response = await fetch(`${API_BASE}/query/studies?${params.toString()}`);
-
-      if (!response.ok) {
-        throw new Error(`Request failed with status ${response.status}`);
-      }
-
-      const data = await response.json();
-      const features = Array.isArray(data?.features) ? data.features : [];
+      // Only request the studies inside the visible part of the map.
+      const features = await requestStudies(filters, bounds, controller.signal);
       setStudies(features);
     } catch (fetchError) {
+      if (controller.signal.aborted) {
+        return;
+      }
       const message = fetchError instanceof Error ? fetchError.message : "Failed to load studies.";
       setError(message);
       setStudies([]);
     } finally {
-      setLoading(false);
+      if (studiesRequestRef.current === controller) {
+        studiesRequestRef.current = null;
+        setLoading(false);
+      }
+    }
+  }, []);
+
+  const handleFilter = async () => {
+    const filters = { startYear, endYear, direction };
+    setAppliedFilters(filters);
+    setHasFiltered(true);
+    setSelectedStudy(null);
+    setStudies([]);
+    await fetchStudies(filters, viewport);
+  };
+
+  const handleViewportChange = (bounds, zoom) => {
+    setViewport(bounds);
+    setMapZoom(zoom);
+    // Once filtered, panning or zooming refreshes the studies for the new viewport.
+    if (appliedFilters) {
+      fetchStudies(appliedFilters, bounds);
     }
   };
 
@@ -154,18 +287,34 @@ export default function MapView() {
     setStartYear(DEFAULT_START_YEAR);
     setEndYear(DEFAULT_END_YEAR);
     setDirection("All");
+    studiesRequestRef.current?.abort();
+    studiesRequestRef.current = null;
+    setLoading(false);
     setStudies([]);
     setError(null);
     setHasFiltered(false);
+    setAppliedFilters(null);
     setSelectedStudy(null);
   };
 
-  const handleExport = () => {
-    if (!studies.length) {
+  const handleExport = async () => {
+    if (!appliedFilters) {
       return;
     }
 
-    const rows = studies.map((feature) => {
+    // The list only holds the studies in view, the export covers every study matching the filters.
+    let features;
+    try {
+      features = await requestStudies(appliedFilters, null);
+    } catch (fetchError) {
+      setError(fetchError instanceof Error ? fetchError.message : "Failed to export studies.");
+      return;
+    }
+    if (!features.length) {
+      return;
+    }
+
+    const rows = features.map((feature) => {
       const props = feature?.properties ?? {};
       const { lat, lon } = getLatLon(feature);
       return [
@@ -309,7 +458,7 @@ export default function MapView() {
               type="button"
               className="export-button"
               onClick={handleExport}
-              disabled={!studies.length || loading}
+              disabled={!appliedFilters || loading}
             >
               Export Results
             </button>
@@ -332,6 +481,7 @@ export default function MapView() {
               attribution={MAP_LAYERS[activeLayer].attribution}
               url={MAP_LAYERS[activeLayer].url}
             />
+            <ViewportTracker onChange={handleViewportChange} />
             {studies.map((feature) => {
               const coordinates = feature?.geometry?.coordinates;
               const properties = feature?.properties;
@@ -396,7 +546,21 @@ export default function MapView() {
                     return null;
                   }
 
-                  const id = feature?.properties?.id ?? `MV-${index + 1}`;
+                  const pointCount = feature?.properties?.point_count;
+                  const id = feature?.properties?.cluster_id ?? feature?.properties?.id ?? `MV-${index + 1}`;
+
+                  if (pointCount) {
+                    return (
+                      <CircleMarker
+                        key={`mv-cluster-${id}`}
+                        center={[lat, lon]}
+                        radius={clusterRadius(feature)}
+                        pathOptions={{ color: "#16a34a", fillColor: "#22c55e", fillOpacity: 0.75 }}
+                      >
+                        <Tooltip>Miovision: {pointCount} points</Tooltip>
+                      </CircleMarker>
+                    );
+                  }
 
                   return (
                     <CircleMarker
@@ -431,7 +595,21 @@ export default function MapView() {
                     return null;
                   }
 
-                  const id = feature?.properties?.id ?? `EST-${index + 1}`;
+                  const pointCount = feature?.properties?.point_count;
+                  const id = feature?.properties?.cluster_id ?? feature?.properties?.id ?? `EST-${index + 1}`;
+
+                  if (pointCount) {
+                    return (
+                      <CircleMarker
+                        key={`est-cluster-${id}`}
+                        center={[lat, lon]}
+                        radius={clusterRadius(feature)}
+                        pathOptions={{ color: "#dc2626", fillColor: "#f87171", fillOpacity: 0.75 }}
+                      >
+                        <Tooltip>Estimation: {pointCount} points</Tooltip>
+                      </CircleMarker>
+                    );
+                  }
 
                   return (
                     <CircleMarker
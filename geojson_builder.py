@@ -0,0 +1,55 @@
+from typing import Mapping, Optional, Sequence
+
+import numpy as np
+import orjson
+from fastapi.responses import Response
+
+GEOJSON_MEDIA_TYPE = "application/geo+json"
+
+
+def valid_coordinates_mask(lons: Sequence, lats: Sequence) -> np.ndarray:
+    """Boolean mask of the positions holding a finite longitude/latitude pair within WGS84 bounds."""
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        return (
+            np.isfinite(lons)
+            & np.isfinite(lats)
+            & (np.abs(lons) <= 180.0)
+            & (np.abs(lats) <= 90.0)
+        )
+
+
+def build_point_features(lons: Sequence, lats: Sequence, properties: Mapping[str, Sequence]) -> list:
+    """
+    Build Point features in bulk from coordinate columns and property columns of the same length.
+
+    Positions with invalid coordinates are skipped. Columns are converted to Python lists once up front, so the
+    per-feature work is limited to assembling the dicts.
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    mask = valid_coordinates_mask(lons, lats)
+
+    names = list(properties)
+    columns = [np.asarray(properties[name])[mask].tolist() for name in names]
+    coordinates = zip(lons[mask].tolist(), lats[mask].tolist())
+
+    return [
+        {
+            "type": "Feature",
+            "properties": dict(zip(names, values)),
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+        }
+        for (lon, lat), *values in zip(coordinates, *columns)
+    ]
+
+
+def feature_collection_bytes(features: list) -> bytes:
+    """Serialize the features as a FeatureCollection straight to UTF-8 bytes."""
+    return orjson.dumps({"type": "FeatureCollection", "features": features}, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def geojson_response(content: bytes, headers: Optional[Mapping[str, str]] = None) -> Response:
+    """Wrap pre-serialized GeoJSON in a raw response, bypassing FastAPI's jsonable_encoder."""
+    return Response(content=content, media_type=GEOJSON_MEDIA_TYPE, headers=headers)
@@ -1,61 +1,98 @@
+import os
 from pathlib import Path
 from typing import Optional
 
-import pandas as pd
-from fastapi import APIRouter, HTTPException, Query
+from dotenv import load_dotenv
+from fastapi import APIRouter, HTTPException, Query, Request
+
+from backend.app.api.bbox import parse_bbox
+from backend.app.api.caching import cache_headers, content_etag, not_modified_response
+from geojson_builder import build_point_features, feature_collection_bytes, geojson_response
+from studies_dataset import DatasetParseError, StudiesDataset
+from studies_repository import StudiesRepository
+
+load_dotenv()
 
 DATA_PATH = Path(__file__).resolve().parent / "data" / "sample_studies.csv"
+DB_URL = os.getenv("DATABASE_URL")
+
+# Studies come from the database when one is configured, the sample file is only a fallback for local demos
+studies_repository = StudiesRepository(DB_URL) if DB_URL else None
+
+# Parsed once and reused until the file changes on disk
+studies_dataset = StudiesDataset(DATA_PATH)
 
 router = APIRouter(prefix="/query", tags=["traffic-studies"])
 
+# Years the database can turn into dates, leaving room for the exclusive end of end_year
+MIN_YEAR = 1
+MAX_YEAR = 9998
+
 
 @router.get("/studies")
 def get_studies(
-    start_year: int = Query(..., description="First year to include"),
-    end_year: int = Query(..., description="Last year to include"),
+    request: Request,
+    start_year: int = Query(..., ge=MIN_YEAR, le=MAX_YEAR, description="First year to include"),
+    end_year: int = Query(..., ge=MIN_YEAR, le=MAX_YEAR, description="Last year to include"),
     direction: Optional[str] = Query(
         None,
         description="Direction filter (e.g., Northbound). Use 'All' or omit to include every direction.",
     ),
+    bbox: Optional[str] = Query(
+        None,
+        description="Only include studies inside minLon,minLat,maxLon,maxLat (e.g., the visible map viewport).",
+    ),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of studies to return"),
 ):
     if start_year > end_year:
         raise HTTPException(status_code=400, detail="start_year must be less than or equal to end_year")
 
     try:
-        df = pd.read_csv(DATA_PATH)
+        bounds = parse_bbox(bbox) if bbox else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if direction and direction.lower() == "all":
+        direction = None
+
+    if studies_repository is not None:
+        try:
+            content = studies_repository.feature_collection(start_year, end_year, direction, bbox=bounds, limit=limit)
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail="Failed to query studies from the database") from exc
+
+        etag = content_etag(content)
+        not_modified = not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+        return geojson_response(content, headers=cache_headers(etag))
+
+    try:
+        snapshot = studies_dataset.snapshot()
     except FileNotFoundError as exc:
         raise HTTPException(status_code=500, detail=f"Dataset not found at {DATA_PATH}") from exc
-    except pd.errors.ParserError as exc:
+    except DatasetParseError as exc:
         raise HTTPException(status_code=500, detail="Failed to parse sample_studies.csv") from exc
 
-    filtered = df[(df["year"] >= start_year) & (df["year"] <= end_year)]
+    # The response is fully determined by the file version and the parameters, so it is only built on a miss
+    etag = content_etag(snapshot.version, start_year, end_year, direction.lower() if direction else None, bounds, limit)
+    not_modified = not_modified_response(request, etag)
+    if not_modified is not None:
+        return not_modified
 
-    if direction and direction.lower() != "all":
-        filtered = filtered[filtered["direction"].str.lower() == direction.lower()]
+    rows = snapshot.select(start_year, end_year, direction or None, bbox=bounds, limit=limit)
 
-    features = []
-    for _, row in filtered.iterrows():
-        try:
-            lat = float(row["lat"])
-            lon = float(row["lon"])
-        except (TypeError, ValueError):
-            # Skip rows that do not have valid coordinates
-            continue
-
-        feature = {
-            "type": "Feature",
-            "properties": {
-                "id": row["id"],
-                "year": int(row["year"]),
-                "direction": row["direction"],
-                "lat": lat,
-                "lon": lon,
-            },
-            "geometry": {
-                "type": "Point",
-                "coordinates": [lon, lat],
-            },
-        }
-        features.append(feature)
-
-    return {"type": "FeatureCollection", "features": features}
+    lats = snapshot.lats[rows]
+    lons = snapshot.lons[rows]
+    # Rows without valid coordinates are skipped by the builder
+    features = build_point_features(
+        lons,
+        lats,
+        {
+            "id": snapshot.ids[rows],
+            "year": snapshot.years[rows],
+            "direction": snapshot.directions.iloc[rows],
+            "lat": lats,
+            "lon": lons,
+        },
+    )
+    return geojson_response(feature_collection_bytes(features), headers=cache_headers(etag))
@@ -1,12 +1,24 @@
-from fastapi import APIRouter, FastAPI
+from fastapi import APIRouter, FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from database_chat import SQLAgent
+from database_chat import DEFAULT_PAGE_SIZE, InvalidContinuationTokenError, QueryRejectedError, SQLAgent, infer_column_types
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse, Response
-from io import BytesIO
-import pandas as pd
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTasks
+from database_export import (COMPRESSIONS, EXPORT_FORMATS, DownloadTokenSigner, ExportFormatError, ExportJob, ExportJobQueue,
+                             InvalidDownloadTokenError, create_temporary_path, iterate_compressed, iterate_csv, iterate_file,
+                             negotiate_format, requires_stream_compression, validate_compression, write_export)
 from query_routes import router as query_router
+from geojson_builder import build_point_features, feature_collection_bytes, geojson_response
+from backend.app.db.pool import get_pool
+from backend.app.metrics import MetricsMiddleware, metrics_response
+from admission_control import AdmissionControlMiddleware, Bulkhead
+from backend.app.api.caching import cache_headers, content_etag, not_modified_response
+from backend.app.api.tiles import router as tiles_router, tile_cache
+from backend.app.api.clusters import router as clusters_router, cluster_cache
+from typing import Any, Callable, Iterable, Iterator, Optional
+import os
+import threading
 
 class RequestBody(BaseModel):
     prompt: str
@@ -20,10 +32,144 @@ class SuggestionsResponse(BaseModel):
 class QueryResponse(BaseModel):
     query:str
 
+class ResultsRequestBody(BaseModel):
+    prompt:str
+    page_size:int = DEFAULT_PAGE_SIZE
+    continuation_token:Optional[str] = None
+
+class ResultsResponse(BaseModel):
+    columns:list[str]
+    rows:list[list[Any]]
+    continuation_token:Optional[str]
+    estimated_total_rows:int
+
+class AnswerResponse(BaseModel):
+    query:str
+    columns:list[str]
+    column_types:list[str]
+    rows:list[list[Any]]
+    continuation_token:Optional[str]
+    estimated_total_rows:int
+    download_token:str
+    download_url:str
+
+class JobResponse(BaseModel):
+    job_id:str
+    status:str
+    export_format:str
+    created_at:float
+    finished_at:Optional[float]
+    size_bytes:Optional[int]
+    error:Optional[str]
+    download_url:Optional[str]
+
 class ErrorResponse(BaseModel):
     error:str
 
-def configure_api_router(router:APIRouter,agent:SQLAgent)->APIRouter:
+MAX_JOB_WAIT_SECONDS = 60.0
+
+def create_job_response(job:ExportJob,status_code:int=200)->JSONResponse:
+    """
+    Describe the state of an export job.
+    """
+    response = JobResponse(
+        job_id=job.job_id,
+        status=job.status,
+        export_format=job.export_format,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        size_bytes=job.size_bytes,
+        error=job.error,
+        download_url=f"/jobs/{job.job_id}/file" if job.status == 'completed' else None
+    )
+    jsonable_response = jsonable_encoder(response)
+    return JSONResponse(content=jsonable_response,status_code=status_code)
+
+class QueryRejectedResponse(BaseModel):
+    error:str
+    action:str
+    estimated_cost:float
+    estimated_rows:int
+    max_cost:float
+    max_rows:int
+
+def create_rejection_response(rejection:QueryRejectedError)->JSONResponse:
+    """
+    Describe why the guardrails refused to run a query.
+    """
+    response = QueryRejectedResponse(
+        error=str(rejection),
+        action=rejection.action,
+        estimated_cost=rejection.estimate.cost,
+        estimated_rows=rejection.estimate.rows,
+        max_cost=rejection.max_cost,
+        max_rows=rejection.max_rows
+    )
+    jsonable_response = jsonable_encoder(response)
+    return JSONResponse(content=jsonable_response,status_code=422)
+
+def iterate_then(chunks:Iterable[bytes],on_complete:Callable[[],None])->Iterator[bytes]:
+    """
+    Pass the chunks through, calling on_complete only once the last one has been consumed. An abandoned stream never
+    calls it.
+    """
+    yield from chunks
+    on_complete()
+
+def create_export_response(agent:SQLAgent,query:str,export_format:str,compression:Optional[str])->StreamingResponse:
+    """
+    Run the query and stream its result as a file of the given format.
+    
+    ### Parameters
+    1. agent : ``SQLAgent``
+        - Agent used to access the database.
+    2. query : ``str``
+        - Query to be exported.
+    3. export_format : ``str``
+        - Key of the format in ``EXPORT_FORMATS``.
+    4. compression : ``str | None``
+        - Key of the compression in ``COMPRESSIONS``.
+    
+    ### Returns
+    A ``StreamingResponse`` containing the file as an attachment.
+    
+    ### Effects
+    Once the whole file is sent, the prompt that generated the query is kept as an example for query generation.
+    """
+    file_format = EXPORT_FORMATS[export_format]
+    columns, row_batches = agent.return_row_batches(query)
+    background = BackgroundTasks()
+    
+    if export_format == 'csv':
+        # CSV needs no finalization, so rows are sent as soon as they leave the database
+        content = iterate_csv(columns=columns,row_batches=row_batches)
+    else:
+        # Other formats are written to disk first, streamed out in chunks, and removed once the response is sent
+        file_path = create_temporary_path(suffix=f".{file_format.extension}")
+        try:
+            write_export(export_format=export_format,columns=columns,row_batches=row_batches,path=file_path,compression=compression)
+        except Exception:
+            os.remove(file_path)
+            raise
+        content = iterate_file(file_path)
+        background.add_task(os.remove,file_path)
+    
+    file_name = f"Book.{file_format.extension}"
+    media_type = file_format.media_type
+    
+    if requires_stream_compression(export_format=export_format,compression=compression):
+        content = iterate_compressed(chunks=content,compression=compression)
+        file_name = f"{file_name}.{COMPRESSIONS[compression].extension}"
+        media_type = COMPRESSIONS[compression].media_type
+    
+    # Background tasks also run after a client disconnects, so the example is only recorded by the content itself
+    content = iterate_then(chunks=content,on_complete=lambda: agent.record_successful_export(query))
+    
+    headers = {'Content-Disposition': f'attachment; filename="{file_name}"'}
+    return StreamingResponse(content=content,headers=headers,media_type=media_type,background=background)
+
+def configure_api_router(router:APIRouter,get_agent:Callable[[],SQLAgent],export_jobs:ExportJobQueue,
+                         download_tokens:DownloadTokenSigner)->APIRouter:
     """
     Given the router, configure paths
     """
@@ -31,13 +177,21 @@ def configure_api_router(router:APIRouter,agent:SQLAgent)->APIRouter:
     def sanity_check():
         return {"Message":"Connection Works"}
     
+    @router.get('/pool')
+    def pool_stats():
+        return get_pool(get_agent().database_connection_string,read_only=True).stats()
+    
+    @router.get('/metrics')
+    def metrics():
+        return metrics_response()
+    
     
 
     @router.post('/validate')
     def post_hander(request_body:RequestBody):
         
         try:
-            is_valid = agent.validate_prompt_adequacy(request_body.prompt)
+            is_valid = get_agent().validate_prompt_adequacy(request_body.prompt)
             response = ValidationResponse(is_valid=is_valid)
             jsonable_response = jsonable_encoder(response)
             return JSONResponse(content=jsonable_response)
@@ -48,43 +202,206 @@ def configure_api_router(router:APIRouter,agent:SQLAgent)->APIRouter:
     
     @router.post('/suggestion')
     def post_handler(request_body:RequestBody):
-        suggestion = agent.generate_prompt_suggestions(request_body.prompt)
+        suggestion = get_agent().generate_prompt_suggestions(request_body.prompt)
         response = SuggestionsResponse(suggestion=suggestion)
         jsonable_response = jsonable_encoder(response)
         return JSONResponse(content=jsonable_response)
     
     @router.post('/query')
     def post_hander(request_body:RequestBody):
-        query = agent.generate_query(request_body.prompt)
+        query = get_agent().generate_query(request_body.prompt)
         response = QueryResponse(query=query)
         jsonable_response = jsonable_encoder(response)
         return JSONResponse(content=jsonable_response)
     
+    @router.post('/results')
+    def post_handler(request_body:ResultsRequestBody):
+        try:
+            page = get_agent().return_page(
+                request_body.prompt,
+                page_size=request_body.page_size,
+                continuation_token=request_body.continuation_token
+            )
+            response = ResultsResponse(
+                columns=page.columns,
+                rows=[list(row) for row in page.rows],
+                continuation_token=page.continuation_token,
+                estimated_total_rows=page.estimated_total_rows
+            )
+            jsonable_response = jsonable_encoder(response)
+            return JSONResponse(content=jsonable_response)
+        except QueryRejectedError as e:
+            return create_rejection_response(e)
+        except InvalidContinuationTokenError as e:
+            error_response = ErrorResponse(error=str(e))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response,status_code=400)
+        except Exception as e:
+            error_response = ErrorResponse(error=str(e.args))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response)
+    
+    @router.post('/answer')
+    def post_handler(request_body:RequestBody):
+        # Generates the query and previews it in one round trip; the file is only built if the download link is followed
+        try:
+            agent = get_agent()
+            query = agent.generate_query(request_body.prompt)
+            page = agent.return_page(query)
+            download_token = download_tokens.issue(query)
+            response = AnswerResponse(
+                query=query,
+                columns=page.columns,
+                column_types=infer_column_types(page.rows,len(page.columns)),
+                rows=[list(row) for row in page.rows],
+                continuation_token=page.continuation_token,
+                estimated_total_rows=page.estimated_total_rows,
+                download_token=download_token,
+                download_url=f"/downloads/{download_token}"
+            )
+            jsonable_response = jsonable_encoder(response)
+            return JSONResponse(content=jsonable_response)
+        except QueryRejectedError as e:
+            return create_rejection_response(e)
+        except Exception as e:
+            error_response = ErrorResponse(error=str(e.args))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response)
+    
+    @router.get('/downloads/{download_token}')
+    def get_handler(
+        download_token:str,
+        request:Request,
+        export_format:Optional[str] = Query(None,alias='format',description="One of xlsx, csv, parquet or arrow. Negotiated from the Accept header when omitted."),
+        compression:Optional[str] = Query(None,description="Optional gzip or zstd compression.")
+    ):
+        try:
+            query = download_tokens.redeem(download_token)
+            export_format = negotiate_format(requested_format=export_format,accept=request.headers.get('accept'))
+            compression = validate_compression(compression)
+        except InvalidDownloadTokenError as e:
+            error_response = ErrorResponse(error=str(e))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response,status_code=404)
+        except Exception as e:
+            error_response = ErrorResponse(error=str(e.args))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response,status_code=400)
+        
+        try:
+            return create_export_response(agent=get_agent(),query=query,export_format=export_format,compression=compression)
+        except QueryRejectedError as e:
+            return create_rejection_response(e)
+        except Exception as e:
+            error_response = ErrorResponse(error=str(e.args))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response)
+    
     @router.post('/excel_file')
     def post_handler(request_body:RequestBody):
         try:
-            df = agent.return_dataframe(request_body.prompt)
-            excel_buffer = BytesIO()
-            
-            with pd.ExcelWriter(path=excel_buffer) as writer:
-                df.to_excel(writer,index=False)
-            
-            excel_buffer.seek(0)
-            headers = {'Content-Disposition': 'attachment; filename="Book.xlsx"'}
-            media_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            return Response(content=excel_buffer.getvalue(),headers=headers,media_type=media_type)
+            return create_export_response(agent=get_agent(),query=request_body.prompt,export_format='xlsx',compression=None)
+        except QueryRejectedError as e:
+            return create_rejection_response(e)
+        except Exception as e:
+            error_response = ErrorResponse(error=str(e.args))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response)
+    
+    @router.post('/export')
+    def post_handler(
+        request_body:RequestBody,
+        request:Request,
+        export_format:Optional[str] = Query(None,alias='format',description="One of xlsx, csv, parquet or arrow. Negotiated from the Accept header when omitted."),
+        compression:Optional[str] = Query(None,description="Optional gzip or zstd compression.")
+    ):
+        try:
+            export_format = negotiate_format(requested_format=export_format,accept=request.headers.get('accept'))
+            compression = validate_compression(compression)
+        except ExportFormatError as e:
+            error_response = ErrorResponse(error=str(e))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response,status_code=400)
+        
+        try:
+            return create_export_response(agent=get_agent(),query=request_body.prompt,export_format=export_format,compression=compression)
+        except QueryRejectedError as e:
+            return create_rejection_response(e)
         except Exception as e:
             error_response = ErrorResponse(error=str(e.args))
             jsonable_response = jsonable_encoder(error_response)
             return JSONResponse(content=jsonable_response)
     
+    @router.post('/jobs')
+    def post_handler(
+        request_body:RequestBody,
+        request:Request,
+        export_format:Optional[str] = Query(None,alias='format',description="One of xlsx, csv, parquet or arrow. Negotiated from the Accept header when omitted."),
+        compression:Optional[str] = Query(None,description="Optional gzip or zstd compression.")
+    ):
+        try:
+            export_format = negotiate_format(requested_format=export_format,accept=request.headers.get('accept'))
+            compression = validate_compression(compression)
+        except Exception as e:
+            error_response = ErrorResponse(error=str(e.args))
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response,status_code=400)
+        
+        job = export_jobs.submit(query=request_body.prompt,export_format=export_format,compression=compression)
+        return create_job_response(job,status_code=202)
+    
+    @router.get('/jobs/{job_id}')
+    def get_handler(job_id:str,wait:float = Query(0,ge=0,le=MAX_JOB_WAIT_SECONDS,description="Seconds to wait for the job to finish before responding.")):
+        job = export_jobs.wait(job_id,timeout=wait) if wait else export_jobs.get(job_id)
+        if job is None:
+            error_response = ErrorResponse(error=f"Job {job_id} does not exist or has expired")
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response,status_code=404)
+        return create_job_response(job)
+    
+    @router.get('/jobs/{job_id}/file')
+    def get_handler(job_id:str):
+        job = export_jobs.get(job_id)
+        if job is None or job.status != 'completed':
+            error_response = ErrorResponse(error=f"Job {job_id} has no result available")
+            jsonable_response = jsonable_encoder(error_response)
+            return JSONResponse(content=jsonable_response,status_code=404)
+        return FileResponse(path=job.path,media_type=job.media_type,filename=job.file_name)
+    
     return router
 
 
 
-agent = SQLAgent()
+shared_agent:Optional[SQLAgent] = None
+shared_agent_lock = threading.Lock()
+
+def get_agent()->SQLAgent:
+    """
+    Return the shared ``SQLAgent``, creating it on first use so that routes which never touch the LLM or the
+    database (GeoJSON, tiles, metrics) do not pay for it on a cold start.
+    """
+    global shared_agent
+    if shared_agent is None:
+        with shared_agent_lock:
+            if shared_agent is None:
+                shared_agent = SQLAgent()
+    return shared_agent
+
+export_jobs = ExportJobQueue.from_environment(fetch_rows=lambda query: get_agent().return_row_batches(query))
 app = FastAPI()
 
+# LLM and export handlers hold a worker thread for seconds to minutes, so each class gets its own bounded share of
+# the thread pool; map layers, tiles, clusters, /query/studies and the health check are never queued behind them
+llm_bulkhead = Bulkhead.from_environment('llm',max_concurrency=4,max_queue=8,queue_timeout=120.0)
+database_bulkhead = Bulkhead.from_environment('database',max_concurrency=8,max_queue=32,queue_timeout=30.0)
+app.add_middleware(
+    AdmissionControlMiddleware,
+    rules=[
+        ({'POST'},r'/(validate|suggestion|query|answer)',llm_bulkhead),
+        ({'POST'},r'/(results|excel_file|export)',database_bulkhead),
+        ({'GET'},r'/downloads/[^/]+',database_bulkhead),
+    ]
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],  # Frontend origins
@@ -92,45 +409,51 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
-router = configure_api_router(APIRouter(),agent)
+download_tokens = DownloadTokenSigner.from_environment()
+router = configure_api_router(APIRouter(),get_agent,export_jobs,download_tokens)
 app.include_router(router=router)
 app.include_router(query_router)
+app.include_router(tiles_router)
+app.include_router(clusters_router)
+
+
+# The placeholder layers never change, so they are serialized once at import
+MV_POINTS_FEATURES = build_point_features(
+    lons=[-113.4938, -113.4903],
+    lats=[53.5461, 53.5444],
+    properties={"id": ["MV-001", "MV-002"]},
+)
+MV_POINTS_GEOJSON = feature_collection_bytes(MV_POINTS_FEATURES)
+
+ESTIMATION_POINTS_FEATURES = build_point_features(
+    lons=[-113.4970, -113.4650],
+    lats=[53.5500, 53.5510],
+    properties={"id": ["EST-001", "EST-002"]},
+)
+ESTIMATION_POINTS_GEOJSON = feature_collection_bytes(ESTIMATION_POINTS_FEATURES)
+
+MV_POINTS_ETAG = content_etag(MV_POINTS_GEOJSON)
+ESTIMATION_POINTS_ETAG = content_etag(ESTIMATION_POINTS_GEOJSON)
+
+# Also served as /tiles/{layer}/{z}/{x}/{y} and /clusters/{layer}, versioned by their content hash
+for point_cache in (tile_cache, cluster_cache):
+    point_cache.register("mv_points_snapped", MV_POINTS_ETAG.strip('"'), MV_POINTS_FEATURES)
+    point_cache.register("estimation_points_snapped", ESTIMATION_POINTS_ETAG.strip('"'), ESTIMATION_POINTS_FEATURES)
 
 
 @app.get("/geojson/mv_points_snapped")
-def get_mv_points():
-    return {
-        "type": "FeatureCollection",
-        "features": [
-            {
-                "type": "Feature",
-                "geometry": {"type": "Point", "coordinates": [-113.4938, 53.5461]},
-                "properties": {"id": "MV-001"},
-            },
-            {
-                "type": "Feature",
-                "geometry": {"type": "Point", "coordinates": [-113.4903, 53.5444]},
-                "properties": {"id": "MV-002"},
-            },
-        ],
-    }
+def get_mv_points(request: Request):
+    not_modified = not_modified_response(request, MV_POINTS_ETAG)
+    if not_modified is not None:
+        return not_modified
+    return geojson_response(MV_POINTS_GEOJSON, headers=cache_headers(MV_POINTS_ETAG))
 
 
 @app.get("/geojson/estimation_points_snapped")
-def get_estimation_points():
-    return {
-        "type": "FeatureCollection",
-        "features": [
-            {
-                "type": "Feature",
-                "geometry": {"type": "Point", "coordinates": [-113.4970, 53.5500]},
-                "properties": {"id": "EST-001"},
-            },
-            {
-                "type": "Feature",
-                "geometry": {"type": "Point", "coordinates": [-113.4650, 53.5510]},
-                "properties": {"id": "EST-002"},
-            },
-        ],
-    }
+def get_estimation_points(request: Request):
+    not_modified = not_modified_response(request, ESTIMATION_POINTS_ETAG)
+    if not_modified is not None:
+        return not_modified
+    return geojson_response(ESTIMATION_POINTS_GEOJSON, headers=cache_headers(ESTIMATION_POINTS_ETAG))
@@ -1,13 +1,14 @@
 import streamlit as st
 import requests
 import time
-from io import BytesIO
 import pandas as pd
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 api_endpoint = os.getenv('SERVER_ENDPOINT')
+# Seconds to connect, and to wait between bytes, before a stalled download is given up
+DOWNLOAD_TIMEOUT = (10,300)
 
 # Set up variables
 st.title(":blue[City of Edmonton] Traffic Volume Chat")
@@ -19,12 +20,45 @@ if "processing_request" not in st.session_state:
 if "saved_prompt" not in st.session_state:
     st.session_state.saved_prompt = None
 
+if "answers" not in st.session_state:
+    st.session_state.answers = {}
+
+if "downloads" not in st.session_state:
+    st.session_state.downloads = {}
+
 
 def stream_data(text:str):
     for word in text.split(" "):
         yield word + " "
         time.sleep(0.05)
 
+def preview_dataframe(answer:dict)->pd.DataFrame:
+    """
+    Build the preview table, restoring the column types that JSON carries as strings.
+    """
+    df = pd.DataFrame(data=answer['rows'],columns=answer['columns'])
+    for column, column_type in zip(answer['columns'],answer['column_types']):
+        if column_type in ('date','datetime'):
+            df[column] = pd.to_datetime(df[column])
+        elif column_type == 'number':
+            df[column] = pd.to_numeric(df[column])
+    return df
+
+def fetch_excel_file(prompt:str,download_url:str):
+    """
+    Fetch the Excel export through this app, so the browser never needs to reach the API server.
+    """
+    try:
+        response = requests.get(url=f"{api_endpoint}{download_url}",params={"format":"xlsx"},timeout=DOWNLOAD_TIMEOUT)
+    except requests.RequestException as e:
+        st.toast(f"Could not download the Excel file: {e}")
+        return
+    # Failed exports come back as a JSON error, some of them with a 200 status
+    if response.headers.get('content-type','').startswith('application/json'):
+        st.toast(response.json().get('error',"Could not build the Excel file"))
+    else:
+        st.session_state.downloads[prompt] = response.content
+
 def reset_chat():
     st.session_state.saved_prompt = None
     st.session_state.processing_request = False
@@ -71,50 +105,60 @@ if st.session_state.saved_prompt and st.session_state.processing_request:
         c1, c2, c3 = st.columns(3)
         c2.button("Write Another Prompt",on_click=reset_chat)
     else:
+        # Reruns (e.g. from widget clicks) reuse the answer instead of regenerating the query
+        answer = st.session_state.answers.get(st.session_state.saved_prompt)
         with st.chat_message("assistant"):
-            with st.spinner(text="Generating SQL Query... (Exp. Time ~ 80-140s)",show_time=True):
-                start_time = time.time()
-                response = requests.post(
-                    url=f"{api_endpoint}/query",
-                    json={
-                        "prompt":st.session_state.saved_prompt
-                    }
-                )
-                query = response.json()['query']
-                end_time = time.time()
-            st.success(f"Successfully qenerated query. Time taken: {round(end_time-start_time,1)}s")
-            description_generator = stream_data("The following query will be used to aggregate data from the database:")
-            st.write_stream(description_generator)
-            st.code(body=query,language='sql')
-        
-        with st.chat_message("assistant"):
-            with st.spinner(text="Aggregating data into Excel format...",show_time=True):
-                response = requests.post(
-                    url=f"{api_endpoint}/excel_file",
-                    json={
-                        "prompt":query
-                    }
-                )
-                file_bytes = response.content
-            st.success("Successfully Recieved Data.")
-        
-        df = pd.read_excel(BytesIO(file_bytes))
+            if answer is None:
+                with st.spinner(text="Generating SQL Query... (Exp. Time ~ 80-140s)",show_time=True):
+                    start_time = time.time()
+                    response = requests.post(
+                        url=f"{api_endpoint}/answer",
+                        json={
+                            "prompt":st.session_state.saved_prompt
+                        }
+                    )
+                    answer = response.json()
+                    end_time = time.time()
+                if "query" in answer:
+                    st.session_state.answers[st.session_state.saved_prompt] = answer
+                    st.success(f"Successfully qenerated query. Time taken: {round(end_time-start_time,1)}s")
+            
+            if "query" in answer:
+                description_generator = stream_data("The following query will be used to aggregate data from the database:")
+                st.write_stream(description_generator)
+                st.code(body=answer['query'],language='sql')
         
         with st.chat_message("assistant"):
-            df_description_generator = stream_data("Preview of the data stored in the Excel file:")
-            st.write_stream(df_description_generator)
-            st.dataframe(df,hide_index=True,)
+            if "rows" in answer:
+                df = preview_dataframe(answer)
+                df_description_generator = stream_data(f"Preview of the data (approximately {answer['estimated_total_rows']} rows in total):")
+                st.write_stream(df_description_generator)
+                st.dataframe(df,hide_index=True,)
+            else:
+                st.error(answer['error'])
         
         columns = st.columns(4)
-        columns[1].download_button(
-            label="Download Excel File",
-            data=file_bytes,
-            file_name="Generated Data.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            icon=":material/download:",
-            on_click=reset_chat,
-            type='primary'
-        )
+        if "download_url" in answer:
+            # The server only builds the file once it is asked for, and the bytes are kept for later reruns
+            file_bytes = st.session_state.downloads.get(st.session_state.saved_prompt)
+            if file_bytes is None:
+                columns[1].button(
+                    label="Prepare Excel File",
+                    on_click=fetch_excel_file,
+                    args=(st.session_state.saved_prompt,answer['download_url']),
+                    icon=":material/table:",
+                    type='primary'
+                )
+            else:
+                columns[1].download_button(
+                    label="Download Excel File",
+                    data=file_bytes,
+                    file_name="Generated Data.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    icon=":material/download:",
+                    on_click=reset_chat,
+                    type='primary'
+                )
         columns[2].button(
             label="Write Another Prompt",
             on_click=reset_chat
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+
+# pandas is only needed to parse the file, so it is imported on the first load rather than at server start
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Roughly 1 km cells at Edmonton's latitude
+GRID_CELL_DEGREES = 0.01
+
+
+class DatasetParseError(ValueError):
+    """Raised when the studies file cannot be parsed."""
+
+
+class SpatialGrid:
+    """Uniform grid over longitude/latitude, storing the row positions of each cell contiguously."""
+
+    def __init__(self, lons: np.ndarray, lats: np.ndarray, cell_size: float = GRID_CELL_DEGREES):
+        self.cell_size = cell_size
+        rows = np.flatnonzero(np.isfinite(lons) & np.isfinite(lats))
+
+        if len(rows):
+            self.min_lon = float(lons[rows].min())
+            self.min_lat = float(lats[rows].min())
+            self.columns = int((lons[rows].max() - self.min_lon) // cell_size) + 1
+            self.grid_rows = int((lats[rows].max() - self.min_lat) // cell_size) + 1
+        else:
+            self.min_lon = self.min_lat = 0.0
+            self.columns = self.grid_rows = 0
+
+        cells = self._cell_ids(lons[rows], lats[rows])
+        order = np.argsort(cells, kind="stable")
+        self._cells = cells[order]
+        self._rows = rows[order]
+
+    def candidates(self, bbox: tuple) -> np.ndarray:
+        """Row positions in every cell touched by the bbox, a superset of the rows inside it."""
+        if not self.columns:
+            return self._rows
+        min_lon, min_lat, max_lon, max_lat = bbox
+        x0, x1 = self._clip(min_lon, max_lon, self.min_lon, self.columns)
+        y0, y1 = self._clip(min_lat, max_lat, self.min_lat, self.grid_rows)
+        if x0 > x1 or y0 > y1:
+            return self._rows[:0]
+
+        # Within one grid row the touched cells have consecutive ids, so each grid row is a single slice
+        first_cells = np.arange(y0, y1 + 1) * self.columns + x0
+        starts = np.searchsorted(self._cells, first_cells, side="left")
+        ends = np.searchsorted(self._cells, first_cells + (x1 - x0), side="right")
+        return np.concatenate([self._rows[start:end] for start, end in zip(starts, ends)])
+
+    def _cell_ids(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        x = ((lons - self.min_lon) // self.cell_size).astype(np.int64)
+        y = ((lats - self.min_lat) // self.cell_size).astype(np.int64)
+        return y * self.columns + x
+
+    def _clip(self, low: float, high: float, origin: float, count: int) -> tuple:
+        first = max(int((low - origin) // self.cell_size), 0)
+        last = min(int((high - origin) // self.cell_size), count - 1)
+        return first, last
+
+
+class StudiesSnapshot:
+    """Immutable columnar copy of the studies file with sorted year/direction indexes and a spatial grid."""
+
+    def __init__(self, df: pd.DataFrame, version: tuple):
+        import pandas as pd
+
+        self.version = version
+
+        years = pd.to_numeric(df["year"], errors="coerce")
+        # Rows without a year can never match a year range, so they are dropped up front
+        df = df[years.notna()]
+        years = years[years.notna()]
+
+        self.ids = df["id"].to_numpy()
+        self.years = years.to_numpy(dtype=np.int16)
+        self.directions = df["direction"].astype("category")
+        self.lats = pd.to_numeric(df["lat"], errors="coerce").to_numpy(dtype=np.float64)
+        self.lons = pd.to_numeric(df["lon"], errors="coerce").to_numpy(dtype=np.float64)
+
+        # Row positions ordered by year, overall and per lower-cased direction
+        self._year_index = self._build_year_index(np.arange(len(self.years)))
+        self._direction_indexes = {}
+        self._direction_codes = {}
+        self._codes = self.directions.cat.codes.to_numpy()
+        for code, category in enumerate(self.directions.cat.categories):
+            key = str(category).lower()
+            rows = np.flatnonzero(self._codes == code)
+            if key in self._direction_indexes:
+                rows = np.concatenate([self._direction_indexes[key][1], rows])
+            self._direction_indexes[key] = self._build_year_index(rows)
+            self._direction_codes.setdefault(key, []).append(code)
+
+        self._grid = SpatialGrid(self.lons, self.lats)
+
+    def __len__(self):
+        return len(self.years)
+
+    def select(
+        self,
+        start_year: int,
+        end_year: int,
+        direction: Optional[str] = None,
+        bbox: Optional[tuple] = None,
+        limit: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Return the row positions, in file order, within the year range and, if given, the direction
+        (case-insensitive) and the (min_lon, min_lat, max_lon, max_lat) bbox, keeping at most limit rows.
+        """
+        rows = self._select_years(start_year, end_year, direction)
+
+        if bbox is not None:
+            grid_rows = self._grid.candidates(bbox)
+            if len(grid_rows) < len(rows):
+                # Fewer rows fall in the viewport than in the year range, so filter those by year and direction
+                rows = grid_rows
+                years = self.years[rows]
+                mask = (years >= start_year) & (years <= end_year)
+                if direction is not None:
+                    mask &= np.isin(self._codes[rows], self._direction_codes.get(direction.lower(), []))
+                rows = rows[mask]
+            min_lon, min_lat, max_lon, max_lat = bbox
+            lons = self.lons[rows]
+            lats = self.lats[rows]
+            rows = rows[(lons >= min_lon) & (lons <= max_lon) & (lats >= min_lat) & (lats <= max_lat)]
+
+        rows = np.sort(rows)
+        return rows if limit is None else rows[:limit]
+
+    def _select_years(self, start_year: int, end_year: int, direction: Optional[str]) -> np.ndarray:
+        if direction is None:
+            sorted_years, rows = self._year_index
+        else:
+            sorted_years, rows = self._direction_indexes.get(direction.lower(), (self.years[:0], self._year_index[1][:0]))
+
+        start = np.searchsorted(sorted_years, start_year, side="left")
+        end = np.searchsorted(sorted_years, end_year, side="right")
+        return rows[start:end]
+
+    def _build_year_index(self, rows: np.ndarray) -> tuple:
+        order = rows[np.argsort(self.years[rows], kind="stable")]
+        return self.years[order], order
+
+
+class StudiesDataset:
+    """Loads the studies file once and reloads it only when its modification time or size changes."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._snapshot: Optional[StudiesSnapshot] = None
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> StudiesSnapshot:
+        """
+        Return the current snapshot, reloading the file first if it changed on disk.
+
+        Raises FileNotFoundError if the file is missing and DatasetParseError if it cannot be parsed.
+        """
+        stat = os.stat(self.path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        with self._lock:
+            # Another request may have reloaded the file while this one waited for the lock
+            if self._snapshot is None or self._snapshot.version != version:
+                import pandas as pd
+
+                try:
+                    df = pd.read_csv(self.path)
+                except pd.errors.ParserError as exc:
+                    raise DatasetParseError(f"Failed to parse {self.path}") from exc
+                # The new snapshot is fully built before it replaces the old one, so readers never see partial data
+                self._snapshot = StudiesSnapshot(df, version)
+            return self._snapshot
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from psycopg2 import errors
+
+from backend.app.db.pool import get_pool
+from backend.app.metrics import DB_QUERY_DURATION
+from geojson_builder import build_point_features, feature_collection_bytes
+
+STATEMENT_NAME = "query_studies"
+
+# One row per study direction, matching the shape of the sample_studies.csv rows
+PREPARE_STATEMENT = f"""
+    PREPARE {STATEMENT_NAME} (integer, integer, text, double precision, double precision,
+                              double precision, double precision, bigint) AS
+    SELECT s.miovision_id,
+           EXTRACT(YEAR FROM s.study_date)::integer,
+           d.direction_name,
+           s.latitude::double precision,
+           s.longitude::double precision
+    FROM studies s
+    JOIN studies_directions sd ON sd.miovision_id = s.miovision_id
+    JOIN direction_types d ON d.id = sd.direction_type_id
+    WHERE s.study_date >= make_date($1, 1, 1)
+      AND s.study_date < make_date($2 + 1, 1, 1)
+      AND ($3::text IS NULL OR lower(d.direction_name) = lower($3))
+      AND ($4::double precision IS NULL OR (
+           s.longitude BETWEEN $4 AND $6 AND s.latitude BETWEEN $5 AND $7))
+    ORDER BY s.miovision_id, d.direction_name
+    LIMIT $8;
+"""
+
+EXECUTE_STATEMENT = f"EXECUTE {STATEMENT_NAME} (%s, %s, %s, %s, %s, %s, %s, %s);"
+
+DEFAULT_CACHE_SIZE = 256
+# The data version only changes when an ingestion run finishes, so it is rechecked at most this often
+VERSION_CHECK_INTERVAL = 5.0
+
+
+class StudiesRepository:
+    """Serves /query/studies from the studies table, caching each response until the data version changes."""
+
+    def __init__(self, dsn: str, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.dsn = dsn
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # Connections are pooled and reused, so each one only needs the statement prepared once
+        self._prepared = set()
+        self._version = None
+        self._version_checked_at = float("-inf")
+
+    def feature_collection(
+        self,
+        start_year: int,
+        end_year: int,
+        direction: Optional[str] = None,
+        bbox: Optional[tuple] = None,
+        limit: Optional[int] = None,
+    ) -> bytes:
+        """Return the serialized FeatureCollection of the matching studies."""
+        key = (start_year, end_year, direction.lower() if direction else None, bbox, limit)
+        version = self._data_version()
+
+        if version is not None:
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None and cached[0] == version:
+                    self._cache.move_to_end(key)
+                    return cached[1]
+
+        min_lon, min_lat, max_lon, max_lat = bbox if bbox else (None, None, None, None)
+        rows = self._execute((start_year, end_year, direction, min_lon, min_lat, max_lon, max_lat, limit))
+
+        ids, years, directions, lats, lons = zip(*rows) if rows else ((), (), (), (), ())
+        content = feature_collection_bytes(
+            build_point_features(
+                lons,
+                lats,
+                {"id": ids, "year": years, "direction": directions, "lat": lats, "lon": lons},
+            )
+        )
+
+        # Without a data version there is no way to tell when the result goes stale, so nothing is cached
+        if version is not None:
+            with self._lock:
+                self._cache[key] = (version, content)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return content
+
+    def _execute(self, parameters: tuple) -> list:
+        with get_pool(self.dsn).connection() as conn:
+            for attempt in range(2):
+                if id(conn) not in self._prepared:
+                    with conn.cursor() as cur:
+                        cur.execute(PREPARE_STATEMENT)
+                    # Committed so the statement outlives the transaction it was created in
+                    conn.commit()
+                    self._prepared.add(id(conn))
+
+                try:
+                    with conn.cursor() as cur, DB_QUERY_DURATION.time("query_studies"):
+                        cur.execute(EXECUTE_STATEMENT, parameters)
+                        return cur.fetchall()
+                except errors.InvalidSqlStatementName:
+                    # A new connection can reuse the id of a closed one that had the statement prepared
+                    conn.rollback()
+                    self._prepared.discard(id(conn))
+                    if attempt:
+                        raise
+
+    def _data_version(self) -> Optional[int]:
+        now = time.monotonic()
+        if now - self._version_checked_at < VERSION_CHECK_INTERVAL:
+            return self._version
+
+        version = None
+        with get_pool(self.dsn).connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT version FROM data_version;")
+                    row = cur.fetchone()
+                    version = row[0] if row else None
+            except errors.UndefinedTable:
+                conn.rollback()
+
+        with self._lock:
+            if version != self._version:
+                self._cache.clear()
+            self._version = version
+            self._version_checked_at = now
+        return version